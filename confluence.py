@@ -1,29 +1,196 @@
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Mapping, Optional
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from collections import OrderedDict, deque
 from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult, TextContent
 import httpx
 import sys
-from urllib.parse import quote
+from urllib.parse import quote, urljoin
+import io
+import re
+import html
+from html.parser import HTMLParser
 import base64
 import os
 from dotenv import load_dotenv
 import signal
+import asyncio
+import contextvars
+import functools
+import json
+try:
+    import orjson
+except ImportError:  # optional, falls back to msgspec or the stdlib
+    orjson = None
+try:
+    import msgspec
+except ImportError:  # optional, falls back to the stdlib
+    msgspec = None
+import random
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize FastMCP server
-mcp = FastMCP("confluence")
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# JSON codec: orjson or msgspec when installed, the stdlib otherwise.
+# Responses are decoded straight from their bytes, without building a str first.
+JSON_DECODER = os.getenv("JSON_DECODER", "auto").strip().lower()
+
+def select_json_codec(name: str) -> tuple[str, Any, Any]:
+    """Pick a (name, loads, dumps) triple; loads accepts bytes or str, dumps returns compact str."""
+    if name in ("auto", "orjson") and orjson is not None:
+        return "orjson", orjson.loads, lambda value: orjson.dumps(value).decode("utf-8")
+    if name in ("auto", "msgspec") and msgspec is not None:
+        decoder, encoder = msgspec.json.Decoder(), msgspec.json.Encoder()
+        return "msgspec", decoder.decode, lambda value: encoder.encode(value).decode("utf-8")
+    if name not in ("auto", "json"):
+        print(f"JSON_DECODER={name} is not available, using the stdlib json module", file=sys.stderr)
+    return "json", json.loads, lambda value: json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+JSON_CODEC, load_json, dump_json = select_json_codec(JSON_DECODER)
 
 # Constants
-mcp.settings.port = int(os.getenv("PORT"))
 CONFLUENCE_BASE_URL = os.getenv("CONFLUENCE_BASE_URL")
 USERNAME = os.getenv("USERNAME")
 API_TOKEN = os.getenv("API_TOKEN")
+CONFLUENCE_PAT = os.getenv("CONFLUENCE_PAT")
 
 # Ensure required environment variables are set
-if not CONFLUENCE_BASE_URL or not USERNAME or not API_TOKEN:
+if not CONFLUENCE_BASE_URL or not ((USERNAME and API_TOKEN) or CONFLUENCE_PAT):
     raise ValueError("Missing required environment variables. Please check your .env file.")
 
+@dataclass(frozen=True)
+class ConfluenceAuth:
+    """Credentials for one Confluence site, resolved once into request headers."""
+    base_url: str
+    headers: Mapping[str, str]
+
+    @classmethod
+    def basic(cls, base_url: str, username: str, api_token: str) -> "ConfluenceAuth":
+        token = base64.b64encode(f"{username}:{api_token}".encode("utf-8")).decode("ascii")
+        return cls._build(base_url, f"Basic {token}")
+
+    @classmethod
+    def bearer(cls, base_url: str, token: str) -> "ConfluenceAuth":
+        """Personal access token (Data Center) or OAuth bearer token."""
+        return cls._build(base_url, f"Bearer {token}")
+
+    @classmethod
+    def _build(cls, base_url: str, authorization: str) -> "ConfluenceAuth":
+        headers = MappingProxyType({
+            "Authorization": authorization,
+            "Accept": "application/json",
+        })
+        return cls(base_url=base_url.rstrip("/"), headers=headers)
+
+# Credentials of the configured site, used unless a request passes its own
+if CONFLUENCE_PAT:
+    DEFAULT_AUTH = ConfluenceAuth.bearer(CONFLUENCE_BASE_URL, CONFLUENCE_PAT)
+else:
+    DEFAULT_AUTH = ConfluenceAuth.basic(CONFLUENCE_BASE_URL, USERNAME, API_TOKEN)
+
+# HTTP connection pool settings
+HTTP2_ENABLED = env_bool("HTTP2_ENABLED", True)
+HTTP_MAX_CONNECTIONS = env_int("HTTP_MAX_CONNECTIONS", 20)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10)
+HTTP_KEEPALIVE_EXPIRY = env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+HTTP_COMPRESSION = env_bool("HTTP_COMPRESSION", True)
+
+def accept_encoding() -> str:
+    """Accept-Encoding listing what httpx can decode here, best compression first.
+
+    zstd and brotli need the optional zstandard and brotli (or brotlicffi) packages.
+    """
+    if not HTTP_COMPRESSION:
+        return "identity"
+    encodings = []
+    try:
+        import zstandard  # noqa: F401
+        encodings.append("zstd")
+    except ImportError:
+        pass
+    try:
+        import brotli  # noqa: F401
+        encodings.append("br;q=0.9")
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            encodings.append("br;q=0.9")
+        except ImportError:
+            pass
+    encodings += ["gzip;q=0.8", "deflate;q=0.5"]
+    return ", ".join(encodings)
+
+# Shared client, created on server startup and closed on shutdown
+_http_client: Optional[httpx.AsyncClient] = None
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the pooled, keep-alive client used for all Confluence requests."""
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            # httpx needs the optional h2 package for HTTP/2; fall back to HTTP/1.1
+            print("h2 is not installed, falling back to HTTP/1.1", file=sys.stderr)
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    headers = {"Accept-Encoding": accept_encoding()}
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=REQUEST_TIMEOUT, headers=headers)
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if the server lifespan has not."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP):
+    """Hold the shared HTTP client and page store open for the lifetime of the server."""
+    get_http_client()
+    try:
+        yield
+    finally:
+        await close_http_client()
+        if PAGE_STORE:
+            PAGE_STORE.close()
+
+# Initialize FastMCP server
+mcp = FastMCP("confluence", lifespan=server_lifespan)
+mcp.settings.port = int(os.getenv("PORT"))
+
 # Define a signal handler function
 def signal_handler(sig, frame):
     print('Shutting down server...')
@@ -32,185 +199,2567 @@ def signal_handler(sig, frame):
 # Register the signal handler for SIGINT
 signal.signal(signal.SIGINT, signal_handler)
 
-async def make_confluence_request(url: str, method: str = "GET", params: dict = None) -> dict[str, Any] | None:
-    """Make a request to the Confluence API with proper error handling."""
-    if not USERNAME or not API_TOKEN:
-        return "Error: Please set your Confluence username and API token"
+# Client-side rate limiting
+RATE_LIMIT_PER_SECOND = env_float("RATE_LIMIT_PER_SECOND", 10.0)
+RATE_LIMIT_BURST = env_int("RATE_LIMIT_BURST", 20)
+RATE_LIMIT_MAX_RETRIES = env_int("RATE_LIMIT_MAX_RETRIES", 5)
+RATE_LIMIT_MAX_WAIT = env_float("RATE_LIMIT_MAX_WAIT", 60.0)
 
-    # Create basic auth header
-    auth_string = f"{USERNAME}:{API_TOKEN}"
-    auth_bytes = auth_string.encode('ascii')
-    base64_auth = base64.b64encode(auth_bytes).decode('ascii')
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
-    headers = {
-        "Authorization": f"Basic {base64_auth}",
-        "Accept": "application/json"
-    }
-    
-    async with httpx.AsyncClient() as client:
+def parse_reset_time(value: Optional[str]) -> Optional[float]:
+    """Seconds until an X-RateLimit-Reset timestamp (ISO 8601 or epoch seconds)."""
+    if not value:
+        return None
+    try:
+        reset = float(value)
+        return max(0.0, reset - time.time())
+    except ValueError:
+        pass
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class RateLimiter:
+    """Token bucket that adapts to the budget Confluence reports back.
+
+    Waiters queue on an asyncio.Lock, which wakes them in FIFO order, so after a
+    pause callers are released one token at a time instead of all at once.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = max(rate, 0.01)
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for the given time and restart from an empty bucket."""
+        now = time.monotonic()
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = self.blocked_until
+
+    def update_from_headers(self, headers: httpx.Headers) -> None:
+        """Learn the real budget from X-RateLimit-* response headers."""
+        limit = headers.get("X-RateLimit-Limit")
+        fill_rate = headers.get("X-RateLimit-FillRate")
+        interval = headers.get("X-RateLimit-Interval-Seconds")
+        remaining = headers.get("X-RateLimit-Remaining")
+        try:
+            if limit:
+                self.capacity = max(int(float(limit)), 1)
+            if fill_rate:
+                self.rate = max(float(fill_rate) / float(interval or 1), 0.01)
+            if remaining is not None:
+                self._refill(time.monotonic())
+                self.tokens = min(self.tokens, float(remaining))
+        except ValueError:
+            return
+        if remaining is not None and self.tokens < 1:
+            reset_in = parse_reset_time(headers.get("X-RateLimit-Reset"))
+            if reset_in:
+                self.pause(reset_in)
+
+# One bucket per site, since Confluence budgets are per account and instance
+_rate_limiters: dict[str, RateLimiter] = {}
+
+def rate_limiter_for(auth: ConfluenceAuth) -> RateLimiter:
+    limiter = _rate_limiters.get(auth.base_url)
+    if limiter is None:
+        limiter = _rate_limiters[auth.base_url] = RateLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+    return limiter
+
+# Retries for transient failures
+RETRY_MAX_ATTEMPTS = env_int("RETRY_MAX_ATTEMPTS", 3)
+RETRY_BASE_DELAY = env_float("RETRY_BASE_DELAY", 0.5)
+RETRY_MAX_DELAY = env_float("RETRY_MAX_DELAY", 8.0)
+REQUEST_TIMEOUT = env_float("REQUEST_TIMEOUT", 30.0)
+REQUEST_DEADLINE = env_float("REQUEST_DEADLINE", 60.0)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUS_CODES = frozenset({502, 503, 504})
+RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised when a request (including its retries) runs out of time."""
+
+# Per-tool timeouts: connect, read and pool timeouts of each attempt, and a
+# deadline for the whole tool call that every upstream request and retry shares
+@dataclass(frozen=True)
+class ToolTimeouts:
+    connect: float
+    read: float
+    pool: float
+    deadline: float
+
+    def for_attempt(self, remaining: float) -> httpx.Timeout:
+        """Attempt timeouts, none of them running past the remaining deadline."""
+        return httpx.Timeout(
+            connect=min(self.connect, remaining),
+            read=min(self.read, remaining),
+            write=min(self.read, remaining),
+            pool=min(self.pool, remaining),
+        )
+
+def env_timeouts(name: str, default: ToolTimeouts) -> ToolTimeouts:
+    """Read "connect,read,pool,deadline" seconds from an environment variable."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    return ToolTimeouts(*(float(part) for part in value.split(",")))
+
+DEFAULT_TIMEOUTS = ToolTimeouts(REQUEST_TIMEOUT, REQUEST_TIMEOUT, REQUEST_TIMEOUT, REQUEST_DEADLINE)
+TOOL_TIMEOUTS = {
+    "list_spaces": env_timeouts("TIMEOUTS_LIST_SPACES", ToolTimeouts(5.0, 15.0, 5.0, 30.0)),
+    "search_content": env_timeouts("TIMEOUTS_SEARCH_CONTENT", ToolTimeouts(5.0, 15.0, 5.0, 20.0)),
+    "get_page_content": env_timeouts("TIMEOUTS_GET_PAGE_CONTENT", ToolTimeouts(5.0, 30.0, 10.0, 60.0)),
+    "get_page_outline": env_timeouts("TIMEOUTS_GET_PAGE_OUTLINE", ToolTimeouts(5.0, 30.0, 10.0, 60.0)),
+    "get_pages": env_timeouts("TIMEOUTS_GET_PAGES", ToolTimeouts(5.0, 30.0, 10.0, 120.0)),
+    "list_pages_in_space": env_timeouts("TIMEOUTS_LIST_PAGES_IN_SPACE", ToolTimeouts(5.0, 60.0, 10.0, 300.0)),
+}
+
+# Timeouts and deadline (a time.monotonic() value) of the tool call being served
+_tool_timeouts: contextvars.ContextVar[Optional[ToolTimeouts]] = contextvars.ContextVar("tool_timeouts", default=None)
+_tool_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("tool_deadline", default=None)
+
+def with_tool_deadline(fn):
+    """Run a tool under its TOOL_TIMEOUTS entry.
+
+    All upstream requests made while serving the call, including retries and
+    the many requests of bulk tools, share one deadline, and the call as a
+    whole is cut off when it is reached.
+    """
+    timeouts = TOOL_TIMEOUTS.get(fn.__name__, DEFAULT_TIMEOUTS)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        deadline = time.monotonic() + timeouts.deadline
+        outer = _tool_deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+        # Upstream requests stop a little early, leaving time to fall back to cached data
+        reserve = min(1.0, timeouts.deadline * 0.1)
+        timeouts_token = _tool_timeouts.set(timeouts)
+        deadline_token = _tool_deadline.set(deadline - reserve)
+        try:
+            return await asyncio.wait_for(fn(*args, **kwargs), timeout=max(deadline - time.monotonic(), 0.001))
+        except asyncio.TimeoutError:
+            message = f"Error: {fn.__name__} did not finish within its {timeouts.deadline:g}s deadline"
+            return error_output(message, kwargs.get("output") or "text")
+        finally:
+            _tool_timeouts.reset(timeouts_token)
+            _tool_deadline.reset(deadline_token)
+
+    return wrapper
+
+# Circuit breaker: stop sending requests to a site that keeps failing or is too slow
+CIRCUIT_BREAKER_ENABLED = env_bool("CIRCUIT_BREAKER_ENABLED", True)
+CIRCUIT_WINDOW = env_int("CIRCUIT_WINDOW", 20)
+CIRCUIT_MIN_CALLS = env_int("CIRCUIT_MIN_CALLS", 10)
+CIRCUIT_FAILURE_RATE = env_float("CIRCUIT_FAILURE_RATE", 0.5)
+CIRCUIT_SLOW_CALL_SECONDS = env_float("CIRCUIT_SLOW_CALL_SECONDS", 10.0)
+CIRCUIT_SLOW_CALL_RATE = env_float("CIRCUIT_SLOW_CALL_RATE", 0.8)
+CIRCUIT_OPEN_SECONDS = env_float("CIRCUIT_OPEN_SECONDS", 30.0)
+CIRCUIT_HALF_OPEN_TRIALS = env_int("CIRCUIT_HALF_OPEN_TRIALS", 3)
+
+class CircuitOpen(httpx.HTTPError):
+    """Raised instead of sending a request while the site's circuit is open."""
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over the outcomes of recent attempts.
+
+    It opens when the failure rate (connection errors and 5xx responses) or the
+    slow call rate over the window reaches its threshold. An attempt's outcome
+    and latency are taken after its body has been read, so a site that sends
+    headers and then stalls counts as failing and slow. While open, requests
+    fail fast. After CIRCUIT_OPEN_SECONDS a few trial requests are let through
+    (half-open); the circuit closes when they all succeed and opens again on
+    the first failure.
+    """
+
+    def __init__(self):
+        self.state = "closed"
+        self.outcomes: deque[tuple[bool, bool]] = deque(maxlen=CIRCUIT_WINDOW)
+        self.opened_at = 0.0
+        self.trials = 0
+        self.trial_successes = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def acquire(self, url: str) -> None:
+        """Let an attempt through or raise CircuitOpen."""
+        if not CIRCUIT_BREAKER_ENABLED:
+            return
+        if self.state == "open":
+            remaining = CIRCUIT_OPEN_SECONDS - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(f"Circuit open for {url}: Confluence is failing, retry in {remaining:.0f}s")
+            self.state = "half-open"
+            self.trials = 0
+            self.trial_successes = 0
+        if self.state == "half-open":
+            if self.trials >= CIRCUIT_HALF_OPEN_TRIALS:
+                self.rejected += 1
+                raise CircuitOpen(f"Circuit half-open for {url}: waiting for trial requests to finish")
+            self.trials += 1
+
+    def release(self) -> None:
+        """An attempt ended without an outcome (e.g. cancelled)."""
+        if self.state == "half-open" and self.trials:
+            self.trials -= 1
+
+    def record(self, success: bool, latency: float) -> None:
+        if not CIRCUIT_BREAKER_ENABLED:
+            return
+        slow = latency >= CIRCUIT_SLOW_CALL_SECONDS
+        if self.state == "half-open":
+            if not success or slow:
+                self._open()
+                return
+            self.trial_successes += 1
+            if self.trial_successes >= CIRCUIT_HALF_OPEN_TRIALS:
+                self.state = "closed"
+                self.outcomes.clear()
+            return
+        if self.state == "open":
+            return  # a late result from before the circuit opened
+        self.outcomes.append((success, slow))
+        if len(self.outcomes) < CIRCUIT_MIN_CALLS:
+            return
+        failures = sum(1 for ok, _ in self.outcomes if not ok)
+        slow_calls = sum(1 for _, is_slow in self.outcomes if is_slow)
+        if (failures / len(self.outcomes) >= CIRCUIT_FAILURE_RATE
+                or slow_calls / len(self.outcomes) >= CIRCUIT_SLOW_CALL_RATE):
+            self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        self.trips += 1
+
+    def stats(self) -> str:
+        return f"{self.state}, {self.trips} trips, {self.rejected} requests failed fast"
+
+# One breaker per site
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+
+def circuit_breaker_for(auth: ConfluenceAuth) -> CircuitBreaker:
+    breaker = _circuit_breakers.get(auth.base_url)
+    if breaker is None:
+        breaker = _circuit_breakers[auth.base_url] = CircuitBreaker()
+    return breaker
+
+def backoff_delay(attempt: int) -> float:
+    """Capped exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+async def send_confluence_request(
+    url: str,
+    method: str = "GET",
+    params: dict = None,
+    auth: Optional[ConfluenceAuth] = None,
+    deadline: Optional[float] = None,
+    headers: Optional[Mapping[str, str]] = None
+) -> tuple[httpx.Response, bytes, bool]:
+    """Send a request through the rate limiter, retrying transient failures.
+
+    Throttled (429) requests are re-queued for any method; 502/503/504 responses
+    and connection errors are retried only for idempotent methods. Every wait
+    and attempt is bounded by the overall deadline (a time.monotonic() value).
+
+    Inside a tool call the deadline defaults to the tool's deadline and each
+    attempt uses the tool's connect/read/pool timeouts. While the site's
+    circuit breaker is open, CircuitOpen is raised without sending anything.
+
+    The body is streamed within each attempt, so failures while reading it are
+    retried too. Bulkhead slots are held per attempt. Returns the closed response, its body (at most
+    MAX_RESPONSE_BYTES) and whether the body was cut off.
+    """
+    auth = auth or DEFAULT_AUTH
+    limiter = rate_limiter_for(auth)
+    breaker = circuit_breaker_for(auth)
+    request_headers = {**auth.headers, **headers} if headers else auth.headers
+    method = method.upper()
+    retryable = method in IDEMPOTENT_METHODS
+    timeouts = _tool_timeouts.get() or DEFAULT_TIMEOUTS
+    if deadline is None:
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        if _tool_deadline.get() is not None:
+            deadline = min(deadline, _tool_deadline.get())
+
+    client = get_http_client()
+    throttled = 0
+    failures = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline exceeded for {url}")
+        try:
+            await asyncio.wait_for(limiter.acquire(), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Request deadline exceeded waiting for rate limit on {url}")
+
+        timeout = timeouts.for_attempt(max(deadline - time.monotonic(), 0.001))
+        delay = None
+        breaker.acquire(url)
+        started = time.monotonic()
         try:
             if method == "GET":
-                response = await client.get(url, headers=headers, params=params, timeout=30.0)
+                request = client.build_request(method, url, headers=request_headers, params=params, timeout=timeout)
+            else:
+                request = client.build_request(method, url, headers=request_headers, json=params, timeout=timeout)
+            # Bulkhead slots are held only while the request is on the wire, not across
+            # rate limit waits and backoff sleeps; queueing for them is not upstream latency
+            async with bulkhead_for(url):
+                started = time.monotonic()
+                response = await client.send(request, stream=True)
+                content, truncated = await read_capped(response)
+        except RETRY_EXCEPTIONS:
+            breaker.record(False, time.monotonic() - started)
+            if not retryable or failures >= RETRY_MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(failures)
+            failures += 1
+            if time.monotonic() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        except httpx.HTTPError:
+            # Not retried (e.g. a body that fails to decode), but still a failed attempt
+            breaker.record(False, time.monotonic() - started)
+            raise
+        except BaseException:
+            # Cancelled from outside: only an attempt that had already stalled says something about the site
+            latency = time.monotonic() - started
+            if latency >= CIRCUIT_SLOW_CALL_SECONDS:
+                breaker.record(False, latency)
             else:
-                response = await client.request(method, url, headers=headers, json=params, timeout=30.0)
-            
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError as e:
-            return f"Error making request: {str(e)}"
-        except Exception as e:
-            return f"Unexpected error: {str(e)}"
+                breaker.release()
+            raise
 
-@mcp.tool()
+        breaker.record(response.status_code < 500, time.monotonic() - started)
+        limiter.update_from_headers(response.headers)
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+        if response.status_code == 429 and throttled < RATE_LIMIT_MAX_RETRIES:
+            # Throttled: the request was not processed, so queue it behind the pause
+            delay = retry_after if retry_after is not None else min(RATE_LIMIT_MAX_WAIT, 2 ** throttled)
+            if delay > RATE_LIMIT_MAX_WAIT or time.monotonic() + delay >= deadline:
+                return response, content, truncated
+            throttled += 1
+            limiter.pause(delay)
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES and retryable and failures < RETRY_MAX_ATTEMPTS:
+            delay = max(backoff_delay(failures), retry_after or 0.0)
+            if time.monotonic() + delay >= deadline:
+                return response, content, truncated
+            failures += 1
+            await asyncio.sleep(delay)
+            continue
+
+        return response, content, truncated
+
+# Largest response body read into memory; bigger responses are cut off while streaming
+MAX_RESPONSE_BYTES = env_int("MAX_RESPONSE_BYTES", 32 * 1024 * 1024)
+TRANSFER_LOG_SIZE = env_int("TRANSFER_LOG_SIZE", 20)
+
+@dataclass
+class Transfer:
+    method: str
+    path: str
+    encoding: str
+    wire_bytes: int
+    decoded_bytes: int
+
+class TransferStats:
+    """Bytes received on the wire vs. decoded, overall, per encoding and for recent requests."""
+
+    def __init__(self, log_size: int):
+        self.responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.by_encoding: dict[str, list[int]] = {}
+        self.recent: deque[Transfer] = deque(maxlen=log_size)
+
+    def record(self, response: httpx.Response, decoded_bytes: int) -> None:
+        encoding = response.headers.get("Content-Encoding", "identity").lower()
+        wire_bytes = response.num_bytes_downloaded
+        self.responses += 1
+        self.wire_bytes += wire_bytes
+        self.decoded_bytes += decoded_bytes
+        totals = self.by_encoding.setdefault(encoding, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += wire_bytes
+        totals[2] += decoded_bytes
+        self.recent.append(Transfer(response.request.method, response.request.url.path, encoding, wire_bytes, decoded_bytes))
+
+    def stats(self) -> str:
+        saved = 1 - self.wire_bytes / self.decoded_bytes if self.decoded_bytes else 0.0
+        encodings = ", ".join(
+            f"{encoding} {count} ({format_bytes(wire)} for {format_bytes(decoded)})"
+            for encoding, (count, wire, decoded) in self.by_encoding.items()
+        )
+        lines = [f"{self.responses} responses, {format_bytes(self.wire_bytes)} received for "
+                 f"{format_bytes(self.decoded_bytes)} decoded ({saved:.0%} saved)" + (f"; {encodings}" if encodings else "")]
+        lines += [
+            f"  {transfer.method} {transfer.path} {transfer.encoding}: "
+            f"{format_bytes(transfer.wire_bytes)} -> {format_bytes(transfer.decoded_bytes)}"
+            for transfer in reversed(self.recent)
+        ]
+        return "\n".join(lines)
+
+TRANSFER_STATS = TransferStats(TRANSFER_LOG_SIZE)
+
+async def read_capped(response: httpx.Response, max_bytes: Optional[int] = None) -> tuple[bytes, bool]:
+    """Read a streamed response body, stopping after max_bytes.
+
+    Returns the body, or its first max_bytes, and whether it was cut off. The
+    response is closed either way, so an oversized body is never held in full.
+    """
+    max_bytes = MAX_RESPONSE_BYTES if max_bytes is None else max_bytes
+    buffer = bytearray()
+    truncated = False
+    try:
+        async for chunk in response.aiter_bytes():
+            room = max_bytes - len(buffer)
+            if len(chunk) > room:
+                buffer += chunk[:room]
+                truncated = True
+                break
+            buffer += chunk
+    finally:
+        await response.aclose()
+    TRANSFER_STATS.record(response, len(buffer))
+    return bytes(buffer), truncated
+
+# Bulkheads: concurrent upstream requests are capped per endpoint class and
+# overall, so one slow kind of request cannot take every pooled connection
+BULKHEAD_GLOBAL = env_int("BULKHEAD_GLOBAL", HTTP_MAX_CONNECTIONS)
+BULKHEAD_LIMITS = {
+    "search": env_int("BULKHEAD_SEARCH", 4),
+    "content": env_int("BULKHEAD_CONTENT", 12),
+    "space": env_int("BULKHEAD_SPACE", 4),
+    "attachments": env_int("BULKHEAD_ATTACHMENTS", 4),
+}
+
+class Bulkhead:
+    """Semaphore with queue depth and wait time statistics."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def hold(self):
+        started = time.monotonic()
+        waiting = self._semaphore.locked()
+        if waiting:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            if waiting:
+                self.queued -= 1
+        wait = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> str:
+        average = self.total_wait / self.acquired if self.acquired else 0.0
+        return (f"{self.name}: {self.active}/{self.limit} active, {self.queued} queued (max {self.max_queued}), "
+                f"{self.acquired} acquired, wait avg {average:.3f}s max {self.max_wait:.3f}s")
+
+GLOBAL_BULKHEAD = Bulkhead("global", BULKHEAD_GLOBAL)
+BULKHEADS = {name: Bulkhead(name, limit) for name, limit in BULKHEAD_LIMITS.items()}
+
+def endpoint_class(url: str) -> str:
+    path = httpx.URL(url).path
+    if path.endswith("/search"):
+        return "search"
+    if "/attachment" in path or "/download/" in path:
+        return "attachments"
+    if "/space" in path:
+        return "space"
+    return "content"
+
+@asynccontextmanager
+async def bulkhead_for(url: str):
+    """Hold a slot of the URL's endpoint class, then a global one, for one request attempt."""
+    # The class slot is taken first so requests queued behind their class hold no global slot
+    async with BULKHEADS[endpoint_class(url)].hold():
+        async with GLOBAL_BULKHEAD.hold():
+            yield
+
+# Identical GETs currently in flight, shared by every caller that asks for them
+_in_flight: dict[tuple, asyncio.Task] = {}
+
+def request_key(method: str, url: str, params: Optional[dict], auth: ConfluenceAuth) -> tuple:
+    """Key a request on method, URL, normalized params and the credentials used."""
+    items = tuple(sorted((str(key), str(value)) for key, value in (params or {}).items()))
+    return (method.upper(), url, items, auth.headers.get("Authorization"))
+
+class UpstreamError(str):
+    """Error message for a failure of Confluence itself rather than of the request.
+
+    Covers unreachable sites, timeouts, 5xx and 429 responses and an open
+    circuit; callers may fall back to cached data for these.
+    """
+
+def request_error(error: httpx.HTTPError) -> str:
+    # Timeouts and other transport errors often carry no message of their own
+    message = f"Error making request: {str(error) or type(error).__name__}"
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code not in (429,) \
+            and error.response.status_code < 500:
+        return message
+    return UpstreamError(message)
+
+async def fetch_confluence_json(
+    url: str,
+    method: str = "GET",
+    params: dict = None,
+    auth: Optional[ConfluenceAuth] = None
+) -> dict[str, Any] | str:
+    try:
+        response, content, truncated = await send_confluence_request(url, method=method, params=params, auth=auth)
+        response.raise_for_status()
+        if truncated:
+            return f"Error: Response is larger than MAX_RESPONSE_BYTES ({format_bytes(MAX_RESPONSE_BYTES)})"
+        return load_json(content)
+    except httpx.HTTPError as e:
+        return request_error(e)
+    except Exception as e:
+        return f"Unexpected error: {str(e)}"
+
+async def make_confluence_request(
+    url: str,
+    method: str = "GET",
+    params: dict = None,
+    auth: Optional[ConfluenceAuth] = None
+) -> dict[str, Any] | None:
+    """Make a request to the Confluence API with proper error handling.
+
+    Concurrent identical GETs are coalesced into one upstream call and all
+    callers receive the same parsed result, which must not be mutated.
+    """
+    auth = auth or DEFAULT_AUTH
+    if method.upper() != "GET":
+        return await fetch_confluence_json(url, method=method, params=params, auth=auth)
+
+    return await coalesce(
+        request_key(method, url, params, auth),
+        lambda: fetch_confluence_json(url, method=method, params=params, auth=auth)
+    )
+
+async def coalesce(key: tuple, factory):
+    """Run factory() once for all concurrent callers using the same key."""
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shield so one caller being cancelled does not cancel the call for the others
+    return await asyncio.shield(task)
+
+# In-memory page cache
+PAGE_CACHE_MAX_BYTES = env_int("PAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+PAGE_EXPAND = "body.storage,version,space,metadata.labels"
+
+def approx_size(value: Any) -> int:
+    """Approximate memory held by a decoded JSON value, in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + approx_size(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += approx_size(item)
+    return size
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def format_age(seconds: float) -> str:
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= length:
+            return f"{seconds / length:.0f}{unit}"
+    return f"{seconds:.0f}s"
+
+class LRUCache:
+    """Least-recently-used mapping bounded by the total size of its entries in bytes."""
+
+    def __init__(self, max_bytes: int, sizeof=approx_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value) -> bool:
+        """Store a value, evicting least-recently-used entries to make room.
+
+        Returns False if the value alone is larger than the whole cache.
+        """
+        self.pop(key)
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return False
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted
+            self.evictions += 1
+        return True
+
+    def pop(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> str:
+        return (f"{len(self)} entries, {format_bytes(self.current_bytes)} of "
+                f"{format_bytes(self.max_bytes)}, {self.evictions} evictions")
+
+@dataclass
+class CachedPage:
+    data: dict[str, Any]
+    version: Optional[int]
+    etag: Optional[str]
+    fetched_at: float
+    # Parsed bodies by format, so hits and slices do not re-render the storage XHTML
+    rendered: dict[str, "RenderedBody"] = field(default_factory=dict)
+
+    def size(self) -> int:
+        return (sys.getsizeof(self) + approx_size(self.data) + sys.getsizeof(self.etag)
+                + sys.getsizeof(self.rendered) + sum(body.size() for body in self.rendered.values()))
+
+PAGE_CACHE = LRUCache(PAGE_CACHE_MAX_BYTES, sizeof=CachedPage.size)
+
+def page_version(data: dict[str, Any]) -> Optional[int]:
+    return data.get("version", {}).get("number")
+
+# Optional on-disk store
+PAGE_STORE_PATH = os.getenv("PAGE_STORE_PATH")
+# Stored pages younger than this are served before they are revalidated
+PAGE_STORE_MAX_AGE = env_float("PAGE_STORE_MAX_AGE", 3600.0)
+
+# Keep references to fire-and-forget tasks so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+def spawn_background(coro) -> asyncio.Task:
+    # Background work outlives the tool call, so it must not inherit its deadline
+    context = contextvars.copy_context()
+    context.run(_tool_deadline.set, None)
+    context.run(_tool_timeouts.set, None)
+    task = context.run(asyncio.ensure_future, coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def strip_links(value: Any) -> Any:
+    """Drop the _links and _expandable noise Confluence adds to every object."""
+    if isinstance(value, dict):
+        return {key: strip_links(item) for key, item in value.items() if key not in ("_links", "_expandable")}
+    if isinstance(value, list):
+        return [strip_links(item) for item in value]
+    return value
+
+class PageStore:
+    """SQLite store (WAL mode) of fetched pages and listings that survives restarts.
+
+    Calls run in a worker thread so the event loop never blocks on disk I/O.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            site TEXT NOT NULL,
+            page_id TEXT NOT NULL,
+            title TEXT,
+            version INTEGER,
+            space_key TEXT,
+            space_name TEXT,
+            labels TEXT,
+            body TEXT,
+            etag TEXT,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (site, page_id)
+        );
+        CREATE TABLE IF NOT EXISTS listings (
+            site TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            request TEXT NOT NULL,
+            items TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (site, kind, request)
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        def call():
+            with self._lock:
+                return func(self._connection(), *args)
+        try:
+            return await asyncio.to_thread(call)
+        except sqlite3.Error as e:
+            print(f"Page store error: {str(e)}", file=sys.stderr)
+            return None
+
+    async def load_page(self, site: str, page_id: str) -> Optional[CachedPage]:
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT title, version, space_key, space_name, labels, body, etag, fetched_at"
+            " FROM pages WHERE site = ? AND page_id = ?", (site, page_id)).fetchone())
+        if row is None:
+            return None
+        title, version, space_key, space_name, labels, body, etag, fetched_at = row
+        data = {
+            "id": page_id,
+            "title": title,
+            "version": {"number": version},
+            "space": {"key": space_key, "name": space_name},
+            "metadata": {"labels": {"results": [{"name": name} for name in json.loads(labels or "[]")]}},
+            "body": {"storage": {"value": body}},
+        }
+        return CachedPage(data=data, version=version, etag=etag, fetched_at=fetched_at)
+
+    async def save_page(self, site: str, page_id: str, page: CachedPage) -> None:
+        data = page.data
+        labels = [label.get("name") for label in data.get("metadata", {}).get("labels", {}).get("results", [])]
+        row = (
+            site, page_id, data.get("title"), page.version,
+            data.get("space", {}).get("key"), data.get("space", {}).get("name"),
+            json.dumps(labels), data.get("body", {}).get("storage", {}).get("value"),
+            page.etag, page.fetched_at,
+        )
+        await self._run(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row))
+
+    async def touch_page(self, site: str, page_id: str, fetched_at: float) -> None:
+        await self._run(lambda conn: conn.execute(
+            "UPDATE pages SET fetched_at = ? WHERE site = ? AND page_id = ?", (fetched_at, site, page_id)))
+
+    async def load_listing(self, site: str, kind: str, request: str) -> Optional[tuple[list, float]]:
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT items, fetched_at FROM listings WHERE site = ? AND kind = ? AND request = ?",
+            (site, kind, request)).fetchone())
+        if row is None:
+            return None
+        return load_json(row[0]), row[1]
+
+    async def save_listing(self, site: str, kind: str, request: str, items: list) -> None:
+        row = (site, kind, request, json.dumps(items), time.time())
+        await self._run(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)", row))
+
+    async def stats(self) -> str:
+        counts = await self._run(lambda conn: (
+            conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0],
+            conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0],
+        ))
+        if counts is None:
+            return f"{self.path} (unavailable)"
+        return f"{self.path}, {counts[0]} pages, {counts[1]} listings"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+PAGE_STORE = PageStore(PAGE_STORE_PATH) if PAGE_STORE_PATH else None
+
+# Space metadata cache: fresh until the soft TTL, served stale while refreshing until the hard TTL
+SPACE_CACHE_SOFT_TTL = env_float("SPACE_CACHE_SOFT_TTL", 600.0)
+SPACE_CACHE_HARD_TTL = env_float("SPACE_CACHE_HARD_TTL", 86400.0)
+SPACE_CACHE_MAX_BYTES = env_int("SPACE_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+
+# Page listings of a space change more often, so they go stale sooner
+PAGE_LIST_CACHE_SOFT_TTL = env_float("PAGE_LIST_CACHE_SOFT_TTL", 60.0)
+PAGE_LIST_CACHE_HARD_TTL = env_float("PAGE_LIST_CACHE_HARD_TTL", 3600.0)
+PAGE_LIST_CACHE_MAX_BYTES = env_int("PAGE_LIST_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+
+class StaleWhileRevalidateCache:
+    """Memory cache of (value, fetched_at) entries with a soft and a hard TTL."""
+
+    def __init__(self, soft_ttl: float, hard_ttl: float, max_bytes: int):
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = max(hard_ttl, soft_ttl)
+        self.entries = LRUCache(max_bytes)
+
+    def get(self, key) -> Optional[tuple[Any, float]]:
+        return self.entries.get(key)
+
+    def put(self, key, value, fetched_at: Optional[float] = None) -> None:
+        self.entries.put(key, (value, fetched_at or time.time()))
+
+    def is_fresh(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at < self.soft_ttl
+
+    def is_usable(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at < self.hard_ttl
+
+SPACE_CACHE = StaleWhileRevalidateCache(SPACE_CACHE_SOFT_TTL, SPACE_CACHE_HARD_TTL, SPACE_CACHE_MAX_BYTES)
+PAGE_LIST_CACHE = StaleWhileRevalidateCache(PAGE_LIST_CACHE_SOFT_TTL, PAGE_LIST_CACHE_HARD_TTL, PAGE_LIST_CACHE_MAX_BYTES)
+
+# Stale-while-revalidate memory cache of each listing kind
+LISTING_CACHES: dict[str, StaleWhileRevalidateCache] = {"spaces": SPACE_CACHE, "space_pages": PAGE_LIST_CACHE}
+
+async def refresh_listing(kind: str, url: str, params: dict, auth: ConfluenceAuth, request: str) -> list | str:
+    data = await make_confluence_request(url, params=params, auth=auth)
+    if isinstance(data, str):  # Error case
+        return data
+    items = strip_links(data.get("results", []))
+    remember_listing(kind, auth, request, items)
+    return items
+
+def remember_listing(kind: str, auth: ConfluenceAuth, request: str, items: list) -> None:
+    LISTING_CACHES[kind].put((auth.base_url, request), items)
+    if PAGE_STORE:
+        spawn_background(PAGE_STORE.save_listing(auth.base_url, kind, request, items))
+
+def listing_request(url: str, params: dict) -> str:
+    return json.dumps([url, sorted((str(key), str(value)) for key, value in params.items())])
+
+async def load_listing(kind: str, url: str, params: dict) -> list | str:
+    """Return the results of a list call, from memory or the on-disk store when possible.
+
+    Listings are served from memory while fresh, and served stale with a
+    background refresh until their hard TTL. Stored listings warm the memory
+    cache under the same TTLs, so an expired copy is never returned here.
+    """
+    auth = DEFAULT_AUTH
+    request = listing_request(url, params)
+    cache = LISTING_CACHES[kind]
+
+    def refresh_in_background() -> None:
+        spawn_background(coalesce(
+            ("listing-refresh", auth.base_url, kind, request),
+            lambda: refresh_listing(kind, url, params, auth, request)
+        ))
+
+    entry = cache.get((auth.base_url, request))
+    if entry is None and PAGE_STORE:
+        entry = await PAGE_STORE.load_listing(auth.base_url, kind, request)
+        if entry is not None:
+            cache.put((auth.base_url, request), entry[0], entry[1])
+    if entry is not None and cache.is_usable(entry[1]):
+        if not cache.is_fresh(entry[1]):
+            refresh_in_background()
+        return entry[0]
+
+    return await coalesce(
+        ("listing", auth.base_url, kind, request),
+        lambda: refresh_listing(kind, url, params, auth, request)
+    )
+
+# Start of the storage body in a page response, allowing other string fields before "value"
+STORAGE_VALUE = re.compile(rb'"storage"\s*:\s*\{\s*(?:"[^"]*"\s*:\s*"[^"\\]*"\s*,\s*)*"value"\s*:\s*"')
+# The complete characters and escapes at the start of a JSON string literal
+JSON_STRING_PREFIX = re.compile(rb'(?:[^"\\]+|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*')
+
+def partial_json_string(raw: bytes) -> str:
+    """Decode a JSON string literal (without its opening quote) that may be cut off."""
+    prefix = JSON_STRING_PREFIX.match(raw).group(0).decode("utf-8", "ignore")
+    return json.loads(f'"{prefix}"')
+
+async def salvage_page(url: str, auth: ConfluenceAuth, content: bytes) -> dict[str, Any] | str:
+    """Build a page from a response cut off at MAX_RESPONSE_BYTES.
+
+    The storage body is decoded from the bytes that did arrive, and the small
+    metadata is fetched again without the body.
+    """
+    data = await make_confluence_request(url, params={"expand": "version,space,metadata.labels"}, auth=auth)
+    if isinstance(data, str):  # Error case
+        return data
+    match = STORAGE_VALUE.search(content)
+    body = partial_json_string(content[match.end():]) if match else ""
+    note = f"<p>[Page body truncated: the response exceeded {format_bytes(MAX_RESPONSE_BYTES)}]</p>"
+    return {**data, "body": {"storage": {"value": body + note, "representation": "storage"}}}
+
+async def fetch_page(page_id: str, url: str, auth: ConfluenceAuth, cached: Optional[CachedPage]) -> dict[str, Any] | str:
+    """Download a page body, conditionally on the cached ETag when there is one.
+
+    Bodies larger than MAX_RESPONSE_BYTES are cut off while streaming and kept truncated.
+    """
+    headers = {"If-None-Match": cached.etag} if cached and cached.etag else None
+    try:
+        response, content, truncated = await send_confluence_request(
+            url, params={"expand": PAGE_EXPAND}, auth=auth, headers=headers
+        )
+        if response.status_code == 304 and cached:
+            return confirm_page(auth, page_id, cached)
+        response.raise_for_status()
+        if truncated:
+            data = await salvage_page(url, auth, content)
+            if isinstance(data, str):  # Error case
+                return data
+        else:
+            data = strip_links(load_json(content))
+    except httpx.HTTPError as e:
+        return request_error(e)
+    except Exception as e:
+        return f"Unexpected error: {str(e)}"
+
+    # A truncated page has no ETag, so it is revalidated by version
+    cache_page(auth, page_id, data, None if truncated else response.headers.get("ETag"))
+    return data
+
+def cache_page(auth: ConfluenceAuth, page_id: str, data: dict[str, Any], etag: Optional[str] = None) -> None:
+    page = CachedPage(
+        data=data,
+        version=page_version(data),
+        etag=etag,
+        fetched_at=time.time(),
+    )
+    PAGE_CACHE.put((auth.base_url, page_id), page)
+    if PAGE_STORE:
+        spawn_background(PAGE_STORE.save_page(auth.base_url, page_id, page))
+
+def confirm_page(auth: ConfluenceAuth, page_id: str, cached: CachedPage) -> dict[str, Any]:
+    """A cached page Confluence just confirmed as current counts as fetched now."""
+    cached.fetched_at = time.time()
+    if PAGE_STORE:
+        spawn_background(PAGE_STORE.touch_page(auth.base_url, page_id, cached.fetched_at))
+    return cached.data
+
+async def revalidate_page(page_id: str, url: str, auth: ConfluenceAuth) -> dict[str, Any] | str:
+    cached = PAGE_CACHE.get((auth.base_url, page_id))
+    if cached is None and PAGE_STORE:
+        cached = await PAGE_STORE.load_page(auth.base_url, page_id)
+        if cached is not None:
+            PAGE_CACHE.put((auth.base_url, page_id), cached)
+            if time.time() - cached.fetched_at < PAGE_STORE_MAX_AGE:
+                # Recent enough to serve right away and revalidate in the background
+                spawn_background(coalesce(
+                    ("page-refresh", auth.base_url, page_id),
+                    lambda: revalidate_page(page_id, url, auth)
+                ))
+                return cached.data
+            # Older copies are revalidated first; if that fails the caller serves them marked stale
+    if cached is None or cached.etag:
+        return await fetch_page(page_id, url, auth, cached)
+
+    # No ETag: check the current version with a minimal expand before downloading the body
+    probe = await make_confluence_request(url, params={"expand": "version"}, auth=auth)
+    if isinstance(probe, str):
+        return probe
+    if page_version(probe) is not None and page_version(probe) == cached.version:
+        return confirm_page(auth, page_id, cached)
+    return await fetch_page(page_id, url, auth, cached)
+
+async def load_page(page_id: str) -> dict[str, Any] | str:
+    """Return a page with body, version, space and labels, served from cache when unchanged."""
+    url = f"{CONFLUENCE_BASE_URL}/content/{page_id}"
+    auth = DEFAULT_AUTH
+    return await coalesce(("page", auth.base_url, page_id), lambda: revalidate_page(page_id, url, auth))
+
+# Serve-stale fallback: when Confluence itself fails, answer from whatever copy
+# the memory cache or the on-disk store still holds, marked with its age
+@dataclass
+class Staleness:
+    age: float
+    reason: str
+
+    def note(self) -> str:
+        return f"[Stale: Confluence is unavailable, showing a copy from {format_age(self.age)} ago. {self.reason}]"
+
+    def record(self) -> dict[str, Any]:
+        return {"age_seconds": round(self.age), "reason": self.reason}
+
+async def stale_page(page_id: str, error: str) -> Optional[tuple[dict[str, Any], Staleness]]:
+    """The last known copy of a page, if the error was an upstream failure."""
+    if not isinstance(error, UpstreamError):
+        return None
+    auth = DEFAULT_AUTH
+    cached = PAGE_CACHE.get((auth.base_url, page_id))
+    if cached is None and PAGE_STORE:
+        cached = await PAGE_STORE.load_page(auth.base_url, page_id)
+    if cached is None:
+        return None
+    return cached.data, Staleness(time.time() - cached.fetched_at, error.splitlines()[0])
+
+async def stale_listing(kind: str, url: str, params: dict, error: str) -> Optional[tuple[list, Staleness]]:
+    """The last known results of a list call, past any TTL, if the error was an upstream failure."""
+    if not isinstance(error, UpstreamError):
+        return None
+    auth = DEFAULT_AUTH
+    request = listing_request(url, params)
+    entry = LISTING_CACHES[kind].get((auth.base_url, request))
+    if entry is None and PAGE_STORE:
+        entry = await PAGE_STORE.load_listing(auth.base_url, kind, request)
+    if entry is None:
+        return None
+    return entry[0], Staleness(time.time() - entry[1], error.splitlines()[0])
+
+# Pagination
+LIST_PAGE_BATCH_SIZE = env_int("LIST_PAGE_BATCH_SIZE", 250)
+LIST_PAGE_CONCURRENCY = env_int("LIST_PAGE_CONCURRENCY", 4)
+
+def next_page_url(data: dict[str, Any], url: str) -> Optional[str]:
+    """Resolve the relative _links.next of a paged response to an absolute URL."""
+    links = data.get("_links", {})
+    next_link = links.get("next")
+    if not next_link:
+        return None
+    base = links.get("base")
+    if base:
+        return base.rstrip("/") + next_link
+    # Without _links.base, next is relative to the site root that hosts /rest/api
+    site_root = url.split("/rest/api", 1)[0]
+    return site_root + next_link if next_link.startswith("/rest/") else urljoin(url, next_link)
+
+async def count_space_pages(space_key: str) -> Optional[int]:
+    """Total number of pages in a space according to CQL search, or None if unknown."""
+    data = await make_confluence_request(
+        f"{CONFLUENCE_BASE_URL}/search",
+        params={"cql": f'space = "{space_key}" AND type = page', "limit": 1}
+    )
+    if isinstance(data, str):  # Error case
+        return None
+    total = data.get("totalSize")
+    return total if isinstance(total, int) else None
+
+async def fetch_space_page_window(space_key: str, start: int, limit: int, semaphore: asyncio.Semaphore) -> dict[str, Any] | str:
+    params = {
+        "spaceKey": space_key,
+        "type": "page",
+        "start": start,
+        "limit": limit,
+        "expand": "version"
+    }
+    async with semaphore:
+        return await make_confluence_request(f"{CONFLUENCE_BASE_URL}/content", params=params)
+
+def space_pages_url(space_key: str, start: int, limit: int) -> str:
+    params = {"spaceKey": space_key, "type": "page", "start": start, "limit": limit, "expand": "version"}
+    return str(httpx.URL(f"{CONFLUENCE_BASE_URL}/content", params=params))
+
+def window_stride(data: dict[str, Any], requested: int) -> int:
+    """Pages per window the server really serves, which may be capped below what was asked."""
+    limit = data.get("limit")
+    if isinstance(limit, int) and 0 < limit < requested:
+        return limit
+    return requested
+
+async def iter_space_pages(space_key: str, max_results: int, start: int = 0) -> AsyncIterator[list[dict[str, Any]] | str]:
+    """Yield batches of pages in a space, in order, beginning at offset start.
+
+    The first window is fetched together with the total page count; the other
+    offset windows are then fetched concurrently (at most LIST_PAGE_CONCURRENCY
+    at a time) and yielded in order. Windows are spaced by the page size the
+    server reports, since Confluence caps limit below what may be asked. When
+    there is no count, or a window comes back short while more pages follow,
+    _links.next is walked sequentially from there instead. Stops after
+    max_results pages; an error message is yielded as a str and ends iteration.
+    """
+    semaphore = asyncio.Semaphore(LIST_PAGE_CONCURRENCY)
+    batch_size = min(LIST_PAGE_BATCH_SIZE, max_results)
+    first, total = await asyncio.gather(
+        fetch_space_page_window(space_key, start, batch_size, semaphore),
+        count_space_pages(space_key)
+    )
+    if isinstance(first, str):  # Error case
+        yield first
+        return
+    results = first.get("results", [])[:max_results]
+    if not results:
+        return
+    yield strip_links(results)
+
+    remaining = max_results - len(results)
+    offset = start + len(results)
+    if remaining <= 0:
+        return
+    stride = window_stride(first, batch_size)
+    next_url = next_page_url(first, f"{CONFLUENCE_BASE_URL}/content")
+    if len(results) < stride or total is None:
+        # Short first window or unknown size: only _links.next can tell whether more pages follow
+        async for batch in walk_pages(next_url, remaining):
+            yield batch
+        return
+
+    end = min(total, start + max_results)
+    windows = [
+        (window_start, asyncio.ensure_future(
+            fetch_space_page_window(space_key, window_start, min(stride, end - window_start), semaphore)))
+        for window_start in range(offset, end, stride)
+    ]
+    try:
+        for window_start, window in windows:
+            data = await window
+            if isinstance(data, str):  # Error case
+                yield data
+                return
+            results = data.get("results", [])[:remaining]
+            if results:
+                remaining -= len(results)
+                offset = window_start + len(results)
+                yield strip_links(results)
+            expected = min(stride, end - window_start)
+            if len(results) < expected and remaining > 0:
+                # Pages moved or the server served fewer than planned: the
+                # planned windows would leave a gap, so continue sequentially
+                next_url = next_page_url(data, f"{CONFLUENCE_BASE_URL}/content")
+                if next_url is None and results:
+                    next_url = space_pages_url(space_key, offset, stride)
+                async for batch in walk_pages(next_url, remaining):
+                    yield batch
+                return
+        if windows and remaining > 0 and offset == end and end < start + max_results:
+            # The count may be out of date: pick up pages added since it was taken
+            async for batch in walk_pages(next_page_url(data, f"{CONFLUENCE_BASE_URL}/content"), remaining):
+                yield batch
+    finally:
+        for _, window in windows:
+            window.cancel()
+
+async def walk_pages(url: Optional[str], max_results: int) -> AsyncIterator[list[dict[str, Any]] | str]:
+    """Follow _links.next from url until max_results items have been yielded."""
+    remaining = max_results
+    while url and remaining > 0:
+        data = await make_confluence_request(url)
+        if isinstance(data, str):  # Error case
+            yield data
+            return
+        results = data.get("results", [])[:remaining]
+        if not results:
+            return
+        remaining -= len(results)
+        yield strip_links(results)
+        url = next_page_url(data, url)
+
+# Bulk page loading
+BULK_CQL_MAX_LENGTH = env_int("BULK_CQL_MAX_LENGTH", 1500)
+BULK_CHUNK_SIZE = env_int("BULK_CHUNK_SIZE", 50)
+
+def chunk_page_ids(page_ids: list[str]) -> list[list[str]]:
+    """Split numeric page IDs into CQL `id in (...)` chunks that fit the URL length limit."""
+    chunks = []
+    chunk: list[str] = []
+    length = 0
+    for page_id in page_ids:
+        # Each ID costs its own length plus an encoded "," separator
+        cost = len(page_id) + 3
+        if chunk and (length + cost > BULK_CQL_MAX_LENGTH or len(chunk) >= BULK_CHUNK_SIZE):
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(page_id)
+        length += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+async def search_pages_by_id(page_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Fetch pages with one CQL search per chunk; IDs that come back are cached."""
+    url = f"{CONFLUENCE_BASE_URL}/content/search"
+    auth = DEFAULT_AUTH
+    chunks = chunk_page_ids(page_ids)
+    responses = await asyncio.gather(*[
+        make_confluence_request(url, params={
+            "cql": f"id in ({','.join(chunk)})",
+            "limit": len(chunk),
+            "expand": PAGE_EXPAND
+        })
+        for chunk in chunks
+    ])
+
+    pages = {}
+    for data in responses:
+        if isinstance(data, str):  # Error case; those IDs are fetched one by one instead
+            continue
+        for page in strip_links(data.get("results", [])):
+            page_id = str(page.get("id"))
+            pages[page_id] = page
+            cache_page(auth, page_id, page)
+    return pages
+
+async def load_pages(page_ids: list[str]) -> list[dict[str, Any] | str]:
+    """Load many pages, in input order, with as few upstream requests as possible.
+
+    Pages already in the memory cache are revalidated like single pages;
+    only the uncached numeric IDs are fetched with CQL searches.
+    """
+    unique_ids = list(dict.fromkeys(page_ids))
+    auth = DEFAULT_AUTH
+    uncached_ids = [
+        page_id for page_id in unique_ids
+        if page_id.isdigit() and PAGE_CACHE.get((auth.base_url, page_id)) is None
+    ]
+    pages: dict[str, dict[str, Any] | str] = await search_pages_by_id(uncached_ids) if uncached_ids else {}
+
+    missing = [page_id for page_id in unique_ids if page_id not in pages]
+    for page_id, data in zip(missing, await asyncio.gather(*[load_page(page_id) for page_id in missing])):
+        pages[page_id] = data
+    return [pages[page_id] for page_id in page_ids]
+
+# Storage format conversion
+WHITESPACE = re.compile(r"\s+")
+BODY_FORMATS = ("raw", "markdown", "text")
+CODE_MACROS = {"code", "noformat"}
+PANEL_MACROS = {"info": "Info", "note": "Note", "warning": "Warning", "tip": "Tip", "panel": None, "expand": None}
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {"p", "div", "section", "ac:layout", "ac:layout-section", "ac:layout-cell", "ac:rich-text-body"}
+SKIPPED_TAGS = {"style", "script", "ac:placeholder", "ac:task-id"}
+INLINE_MARKERS = {"strong": "**", "b": "**", "em": "_", "i": "_", "s": "~~", "del": "~~"}
+
+class StorageConverter(HTMLParser):
+    """Incremental converter from Confluence storage-format XHTML to Markdown or plain text.
+
+    Feed it the body in one or more chunks and call finish() for the result.
+    Macros are reduced to what they show on the page: code blocks, panels as
+    quotes, links and images as their text, everything else as its body.
+    """
+
+    def __init__(self, markdown: bool = True):
+        super().__init__(convert_charrefs=True)
+        self.markdown = markdown
+        self.out: list[str] = []
+        self._captures: list[list[str]] = []
+        self._skip = 0
+        self._pre = 0
+        self._line_start = True
+        self._lists: list[list] = []
+        self._tables: list[list[list[str]]] = []
+        self._cells = 0
+        self._macros: list[dict[str, Any]] = []
+        self._links: list[dict[str, Any]] = []
+        self._task_status: Optional[str] = None
+        self._parameter = ""
+        self.headings: list[tuple[int, str]] = []
+        self.heading_offsets: list[int] = []
+
+    # Output helpers
+
+    def _write(self, text: str) -> None:
+        if text:
+            self.out.append(text)
+            self._line_start = text.endswith("\n")
+
+    def _block(self) -> None:
+        """Start a new paragraph, or just a space inside list items and table cells."""
+        if self._cells or self._lists:
+            if not self._line_start and self.out and not self.out[-1].endswith(" "):
+                self._write(" ")
+        elif self.out and not self.out[-1].endswith("\n\n"):
+            self._write("\n\n")
+            self._line_start = True
+
+    def _begin(self) -> None:
+        self._captures.append(self.out)
+        self.out = []
+        self._line_start = True
+
+    def _end(self) -> str:
+        if not self._captures:  # stray closing tag
+            return ""
+        text = "".join(self.out)
+        self.out = self._captures.pop()
+        return text
+
+    def _write_block(self, text: str) -> None:
+        self._block()
+        self._write(text)
+        self._block()
+
+    # Parser callbacks
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if self._skip or tag in SKIPPED_TAGS:
+            self._skip += 1
+            return
+        attrs = dict(attrs)
+        if tag in HEADINGS or tag in ("pre", "blockquote", "ac:parameter", "ac:task-status",
+                                      "th", "td", "ac:structured-macro", "ac:link", "ac:image", "a"):
+            if tag in ("th", "td"):
+                self._cells += 1
+            elif tag == "ac:structured-macro":
+                self._macros.append({"name": attrs.get("ac:name", ""), "params": {}, "plain": ""})
+            elif tag in ("ac:link", "ac:image", "a"):
+                self._links.append({"href": attrs.get("href"), "target": None})
+            elif tag == "ac:parameter":
+                self._parameter = attrs.get("ac:name", "")
+            elif tag == "pre":
+                self._pre += 1
+            self._begin()
+        elif tag in BLOCK_TAGS:
+            self._block()
+        elif tag in ("ul", "ol", "ac:task-list"):
+            self._block()
+            self._lists.append([tag == "ol", 0])
+        elif tag == "li":
+            self._list_item()
+        elif tag == "ac:task-body":
+            self._list_item("[x] " if self._task_status == "complete" else "[ ] ")
+        elif tag == "tr":
+            if self._tables:
+                self._tables[-1].append([])
+        elif tag == "table":
+            self._block()
+            self._tables.append([])
+        elif tag == "br":
+            self._write(" " if self._cells else "\n")
+            self._line_start = True
+        elif tag == "hr":
+            self._write_block("---" if self.markdown else "")
+        elif tag == "code" and not self._pre and self.markdown:
+            self._write("`")
+        elif tag in INLINE_MARKERS and self.markdown:
+            self._write(INLINE_MARKERS[tag])
+        elif tag in ("ri:page", "ri:blog-post") and self._links:
+            self._links[-1]["target"] = attrs.get("ri:content-title")
+        elif tag == "ri:attachment" and self._links:
+            self._links[-1]["target"] = attrs.get("ri:filename")
+        elif tag == "ri:url" and self._links:
+            self._links[-1]["href"] = attrs.get("ri:value")
+        elif tag == "ri:user" and self._links:
+            self._links[-1]["target"] = "@" + (attrs.get("ri:username") or attrs.get("ri:account-id") or "user")
+        elif tag == "time" and attrs.get("datetime"):
+            self._write(attrs["datetime"])
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._skip:
+            self._skip -= 1
+            return
+        if tag in HEADINGS:
+            text = WHITESPACE.sub(" ", self._end()).strip()
+            heading = ("#" * HEADINGS[tag] + " " + text) if self.markdown else text
+            if not self._captures and not self._lists:
+                # Mark top-level headings so finish() can report where each section starts
+                self.headings.append((HEADINGS[tag], text))
+                heading = SECTION_MARK + heading
+            self._write_block(heading)
+        elif tag == "pre":
+            self._pre = max(self._pre - 1, 0)
+            self._write_code(self._end(), "")
+        elif tag == "blockquote":
+            self._write_quote(self._end().strip(), None)
+        elif tag == "ac:parameter":
+            value = self._end().strip()
+            if self._macros:
+                self._macros[-1]["params"][self._parameter] = value
+        elif tag == "ac:task-status":
+            self._task_status = self._end().strip()
+        elif tag in ("th", "td"):
+            self._cells = max(self._cells - 1, 0)
+            cell = WHITESPACE.sub(" ", self._end()).strip()
+            if self._tables and self._tables[-1]:
+                self._tables[-1][-1].append(cell.replace("|", "\\|") if self.markdown else cell)
+        elif tag == "table":
+            if self._tables:
+                self._write_table(self._tables.pop())
+        elif tag == "ac:structured-macro":
+            self._end_macro(self._end())
+        elif tag in ("ac:link", "ac:image", "a"):
+            self._end_link(tag, self._end().strip())
+        elif tag in ("ul", "ol", "ac:task-list"):
+            if self._lists:
+                self._lists.pop()
+            if not self._lists:
+                self._block()
+        elif tag in BLOCK_TAGS:
+            self._block()
+        elif tag == "code" and not self._pre and self.markdown:
+            self._write("`")
+        elif tag in INLINE_MARKERS and self.markdown:
+            self._write(INLINE_MARKERS[tag])
+
+    def handle_data(self, data: str) -> None:
+        if self._skip:
+            return
+        data = data.replace(SECTION_MARK, "")
+        if not self._pre:
+            data = WHITESPACE.sub(" ", data)
+            if self._line_start:
+                data = data.lstrip()
+        self._write(data)
+
+    def unknown_decl(self, data: str) -> None:
+        if data.startswith("CDATA["):
+            self._cdata(data[6:])
+
+    def handle_comment(self, data: str) -> None:
+        # Parsers without CDATA support report it as a bogus comment
+        if data.startswith("[CDATA[") and data.endswith("]]"):
+            self._cdata(data[7:-2])
+
+    def _cdata(self, text: str) -> None:
+        if self._skip:
+            return
+        if self._macros and self._macros[-1]["name"] in CODE_MACROS:
+            self._macros[-1]["plain"] += text
+        else:
+            self.handle_data(text)
+
+    # Structures
+
+    def _list_item(self, marker: str = "") -> None:
+        depth = max(len(self._lists) - 1, 0)
+        if self._lists and self._lists[-1][0]:
+            self._lists[-1][1] += 1
+            bullet = f"{self._lists[-1][1]}. "
+        else:
+            bullet = "- "
+        self._write("\n" + "  " * depth + bullet + marker)
+        self._line_start = True
+
+    def _write_code(self, code: str, language: str) -> None:
+        code = code.strip("\n")
+        if self.markdown:
+            self._write_block(f"```{language}\n{code}\n```")
+        else:
+            self._write_block(code)
+
+    def _write_quote(self, text: str, title: Optional[str]) -> None:
+        if title:
+            text = f"**{title}:** {text}" if self.markdown else f"{title}: {text}"
+        if self.markdown:
+            text = re.sub(r"\n{3,}", "\n\n", text)
+            text = "\n".join("> " + line if line else ">" for line in text.split("\n"))
+        self._write_block(text)
+
+    def _write_table(self, rows: list[list[str]]) -> None:
+        rows = [row for row in rows if row]
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+        if self.markdown:
+            lines = ["| " + " | ".join(row) + " |" for row in rows]
+            lines.insert(1, "|" + " --- |" * width)
+        else:
+            lines = [" | ".join(row) for row in rows]
+        self._write_block("\n".join(lines))
+
+    def _end_macro(self, body: str) -> None:
+        macro = self._macros.pop() if self._macros else {"name": "", "params": {}, "plain": ""}
+        name, params = macro["name"], macro["params"]
+        if name in CODE_MACROS:
+            self._write_code(macro["plain"], params.get("language", ""))
+        elif name in PANEL_MACROS:
+            self._write_quote(body.strip(), params.get("title") or PANEL_MACROS[name])
+        elif name == "status":
+            self._write(f"[{params.get('title', '')}]")
+        elif name == "jira":
+            self._write(params.get("key", ""))
+        else:
+            self._write(body)
+
+    def _end_link(self, tag: str, text: str) -> None:
+        link = self._links.pop() if self._links else {"href": None, "target": None}
+        href, target = link["href"], link["target"]
+        if tag == "ac:image":
+            name = target or href or "image"
+            self._write(f"![{name}]({href or name})" if self.markdown else f"[image: {name}]")
+            return
+        text = text or target or href or ""
+        if href and self.markdown:
+            self._write(f"[{text}]({href})")
+        elif href and href != text:
+            self._write(f"{text} ({href})")
+        else:
+            self._write(text)
+
+    def finish(self) -> str:
+        self.close()
+        while self._captures:
+            body = self._end()
+            self._write(body)
+        text = "".join(self.out)
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        text = re.sub(r"\n{3,}", "\n\n", text).strip()
+
+        parts = text.split(SECTION_MARK)
+        offset = len(parts[0])
+        for part in parts[1:]:
+            self.heading_offsets.append(offset)
+            offset += len(part)
+        return "".join(parts)
+
+@dataclass
+class Section:
+    id: str
+    level: int
+    title: str
+    start: int
+    end: int
+
+@dataclass
+class RenderedBody:
+    """A page body in one format, with the character range of every section."""
+    body_format: str
+    text: str
+    sections: list[Section]
+
+    def size(self) -> int:
+        # Raw bodies share their string with the cached page data
+        text_size = 0 if self.body_format == "raw" else sys.getsizeof(self.text)
+        return sys.getsizeof(self) + text_size + sum(
+            sys.getsizeof(section) + sys.getsizeof(section.title) for section in self.sections
+        )
+
+    def find_section(self, selector: str) -> Optional[Section]:
+        """Find a section by ID (e.g. "2.1"), exact title or title substring."""
+        selector = selector.strip()
+        for section in self.sections:
+            if section.id == selector:
+                return section
+        lowered = selector.lower()
+        for section in self.sections:
+            if section.title.lower() == lowered:
+                return section
+        for section in self.sections:
+            if lowered in section.title.lower():
+                return section
+        return None
+
+SECTION_MARK = "\x00"
+HEADING_TAG = re.compile(r"<h([1-6])\b[^>]*>(.*?)</h\1\s*>", re.S | re.I)
+TAG = re.compile(r"<[^>]+>")
+
+def build_sections(text: str, headings: list[tuple[int, str, int]]) -> list[Section]:
+    """Number headings as a tree ("1", "1.1", ...) and give each section its range.
+
+    A section runs until the next heading of the same or a higher level, so it
+    includes its subsections. Text before the first heading is section "0".
+    """
+    sections = []
+    if headings and text[:headings[0][2]].strip():
+        sections.append(Section("0", 0, "(before first heading)", 0, headings[0][2]))
+
+    levels: list[int] = []
+    path: list[int] = []
+    children = [0]
+    for index, (level, title, start) in enumerate(headings):
+        while levels and levels[-1] >= level:
+            levels.pop()
+            path.pop()
+            children.pop()
+        children[-1] += 1
+        path.append(children[-1])
+        levels.append(level)
+        children.append(0)
+
+        end = len(text)
+        for next_level, _, next_start in headings[index + 1:]:
+            if next_level <= level:
+                end = next_start
+                break
+        sections.append(Section(".".join(map(str, path)), level, title, start, end))
+    return sections
+
+def render_storage(storage: str, body_format: str) -> RenderedBody:
+    """Render storage-format XHTML as raw, markdown or text, with its section outline."""
+    if body_format == "raw":
+        headings = [
+            (int(match.group(1)), WHITESPACE.sub(" ", html.unescape(TAG.sub("", match.group(2)))).strip(), match.start())
+            for match in HEADING_TAG.finditer(storage)
+        ]
+        return RenderedBody(body_format, storage, build_sections(storage, headings))
+
+    converter = StorageConverter(markdown=body_format == "markdown")
+    converter.feed(storage)
+    text = converter.finish()
+    headings = [
+        (level, title, offset)
+        for (level, title), offset in zip(converter.headings, converter.heading_offsets)
+    ]
+    return RenderedBody(body_format, text, build_sections(text, headings))
+
+def convert_storage(storage: str, body_format: str) -> str:
+    """Render storage-format XHTML as raw, markdown or text."""
+    if body_format == "raw":
+        return storage
+    return render_storage(storage, body_format).text
+
+# Field projection: each field a tool can return, with the expand it needs, how it
+# renders as text and its raw value for JSON output
+SPACE_FIELDS = {
+    "name": ("Space", None, lambda space: space.get("name", "Unknown"), lambda space: space.get("name")),
+    "key": ("Key", None, lambda space: space.get("key", "Unknown"), lambda space: space.get("key")),
+    "type": ("Type", None, lambda space: space.get("type", "Unknown"), lambda space: space.get("type")),
+    "description": ("Description", "description.plain",
+                    lambda space: space.get("description", {}).get("plain", {}).get("value", "No description"),
+                    lambda space: space.get("description", {}).get("plain", {}).get("value")),
+    "homepage": ("Homepage", "homepage", lambda space: space.get("homepage", {}).get("title", "None"),
+                 lambda space: space.get("homepage", {}).get("title")),
+}
+DEFAULT_SPACE_FIELDS = ("name", "key", "type", "description")
+
+def label_names(page: dict[str, Any]) -> list[str]:
+    return [label.get("name") for label in page.get("metadata", {}).get("labels", {}).get("results", [])]
+
+PAGE_FIELDS = {
+    "title": ("Title", None, lambda page: page.get("title", "Unknown"), lambda page: page.get("title")),
+    "space": ("Space", "space", lambda page: page.get("space", {}).get("name", "Unknown"),
+              lambda page: page.get("space", {}).get("key")),
+    "version": ("Version", "version", lambda page: page.get("version", {}).get("number", "Unknown"),
+                lambda page: page.get("version", {}).get("number")),
+    "labels": ("Labels", "metadata.labels", lambda page: ", ".join(label_names(page)) or "No labels", label_names),
+    "body": ("Content", "body.storage", lambda page: page.get("body", {}).get("storage", {}).get("value", "No content"),
+             lambda page: page.get("body", {}).get("storage", {}).get("value")),
+}
+DEFAULT_PAGE_FIELDS = ("title", "space", "version", "labels", "body")
+
+SEARCH_FIELDS = {
+    "title": ("Title", None, lambda content: content.get("title", "Unknown"), lambda content: content.get("title")),
+    "type": ("Type", None, lambda content: content.get("type", "Unknown"), lambda content: content.get("type")),
+    "space": ("Space", "space", lambda content: content.get("space", {}).get("name", "Unknown"),
+              lambda content: content.get("space", {}).get("key")),
+    "id": ("ID", None, lambda content: content.get("id", "Unknown"), lambda content: content.get("id")),
+    "updated": ("Last Updated", "version", lambda content: content.get("version", {}).get("when", "Unknown"),
+                lambda content: content.get("version", {}).get("when")),
+}
+DEFAULT_SEARCH_FIELDS = ("title", "type", "space", "id", "updated")
+
+def select_fields(fields: Optional[list[str]], available: dict, default: tuple) -> list[str] | str:
+    """Validate a requested field list, returning an error message for unknown fields."""
+    if not fields:
+        return list(default)
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    selected = list(dict.fromkeys(field.strip().lower() for field in fields if field.strip()))
+    unknown = [field for field in selected if field not in available]
+    if unknown:
+        return f"Error: Unknown field(s) {', '.join(unknown)}. Available fields: {', '.join(available)}"
+    return selected
+
+def expand_for(fields: list[str], available: dict) -> list[str]:
+    """Smallest set of expands that covers the selected fields."""
+    return list(dict.fromkeys(available[field][1] for field in fields if available[field][1]))
+
+def render_fields(item: dict[str, Any], fields: list[str], available: dict, indent: str = "") -> str:
+    return "".join(f"{indent}{available[field][0]}: {available[field][2](item)}\n" for field in fields)
+
+def record_fields(item: dict[str, Any], fields: list[str], available: dict) -> dict[str, Any]:
+    """The selected fields as a flat dict, for JSON output."""
+    return {field: available[field][3](item) for field in fields}
+
+# Output formats: indented text blocks, or JSON objects built straight from the trimmed upstream dicts
+OUTPUT_FORMATS = ("text", "json")
+
+def check_output(output: str) -> Optional[str]:
+    if output not in OUTPUT_FORMATS:
+        return f"Error: Unknown output {output}. Available outputs: {', '.join(OUTPUT_FORMATS)}"
+    return None
+
+def json_result(envelope: dict[str, Any]) -> CallToolResult:
+    """JSON output: the compact dump_json text, with the same object as structured content.
+
+    Built here rather than by FastMCP, which would indent the text and wrap the
+    object in {"result": ...}; the text is what token budgets are measured on.
+    """
+    return CallToolResult(content=[TextContent(type="text", text=dump_json(envelope))], structuredContent=envelope)
+
+def error_output(message: str, output: str) -> str | CallToolResult:
+    """Error messages stay plain text, wrapped in an object in JSON mode."""
+    return json_result({"error": message}) if output == "json" else message
+
+# Response budgets
+DEFAULT_MAX_TOKENS = env_int("DEFAULT_MAX_TOKENS", 0)
+# Room kept for the truncation note itself
+NOTE_TOKENS = 40
+PARAGRAPH_BREAK = re.compile(r"\n\n+")
+LINE_BREAK = re.compile(r"\n")
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate: BPE tokenizers average about 4 UTF-8 bytes per token."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+def token_budget(max_tokens: Optional[int]) -> Optional[int]:
+    budget = max_tokens if max_tokens is not None else DEFAULT_MAX_TOKENS
+    return budget if budget and budget > 0 else None
+
+def encode_cursor(position: dict[str, int]) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def read_cursor(cursor: Optional[str], key: str) -> Optional[int]:
+    """Position stored in a continuation cursor; 0 without a cursor, None if it is invalid."""
+    if not cursor:
+        return 0
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value = position[key]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return value if isinstance(value, int) and value >= 0 else None
+
+def invalid_cursor(cursor: str) -> str:
+    return f"Error: Invalid cursor {cursor}. Pass the cursor exactly as returned by the same tool."
+
+def truncation_note(position: dict[str, int]) -> str:
+    return f'[Output truncated to fit the token budget. Call again with cursor="{encode_cursor(position)}" to continue.]'
+
+def largest_fitting(candidates, fits) -> int:
+    """Largest candidate (ascending, all > 0) for which fits() holds, or 0."""
+    low, high = 0, len(candidates)
+    while low < high:
+        middle = (low + high) // 2
+        if fits(candidates[middle]):
+            low = middle + 1
+        else:
+            high = middle
+    return candidates[low - 1] if low else 0
+
+def fit_text(text: str, max_tokens: int, boundaries: list[int]) -> int:
+    """Length of the longest prefix of text within the budget, cut at a structural boundary.
+
+    Section boundaries are preferred, then paragraph breaks, then line breaks;
+    only text without any of those is cut mid-line. Always at least 1, so a
+    continuation makes progress.
+    """
+    def fits(end: int) -> bool:
+        return estimate_tokens(text[:end]) <= max_tokens
+
+    for candidates in (
+        boundaries,
+        [match.end() for match in PARAGRAPH_BREAK.finditer(text)],
+        [match.end() for match in LINE_BREAK.finditer(text)],
+    ):
+        end = largest_fitting(sorted(position for position in candidates if 0 < position < len(text)), fits)
+        if end:
+            return end
+    return max(largest_fitting(range(1, len(text) + 1), fits), 1)
+
+def fit_count(sizes: list[int], budget: int) -> int:
+    """Number of leading blocks, sized in tokens, that fit the budget with room for a note.
+
+    At least one block is always kept so a continuation makes progress.
+    """
+    if sum(sizes) <= budget:
+        return len(sizes)
+    used = NOTE_TOKENS
+    for count, size in enumerate(sizes):
+        used += size
+        if used > budget and count:
+            return count
+    return len(sizes)
+
+def join_within_budget(blocks: list[str], max_tokens: Optional[int], next_position, separator: str = "\n---\n") -> str:
+    """Join whole result blocks until the budget is used, then add a continuation cursor.
+
+    next_position(count) gives the cursor position after the first count blocks.
+    """
+    budget = token_budget(max_tokens)
+    if budget is None:
+        return separator.join(blocks)
+    separator_tokens = estimate_tokens(separator)
+    count = fit_count([estimate_tokens(block) + separator_tokens for block in blocks], budget)
+    if count == len(blocks):
+        return separator.join(blocks)
+    return separator.join(blocks[:count]) + separator + truncation_note(next_position(count))
+
+def json_within_budget(
+    records: list[dict[str, Any]],
+    max_tokens: Optional[int],
+    next_position,
+    header: Optional[dict[str, Any]] = None,
+    key: str = "results"
+) -> CallToolResult:
+    """JSON object holding the records that fit the budget.
+
+    Records past the budget are dropped and a next_cursor is added instead.
+    """
+    envelope = dict(header or {})
+    envelope[key] = records
+    budget = token_budget(max_tokens)
+    if budget is None:
+        return json_result(envelope)
+    header_tokens = estimate_tokens(dump_json(header)) if header else 0
+    count = fit_count([estimate_tokens(dump_json(record)) + 1 for record in records], budget - header_tokens)
+    if count < len(records):
+        envelope[key] = records[:count]
+        envelope["next_cursor"] = encode_cursor(next_position(count))
+    return json_result(envelope)
+
+@mcp.tool(structured_output=False)
+@with_tool_deadline
 async def list_spaces(
     query: Optional[str] = None,
-    limit: Optional[int] = 25
-) -> str:
+    limit: Optional[int] = 25,
+    fields: Optional[list[str]] = None,
+    max_tokens: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: Optional[str] = "text"
+) -> str | CallToolResult:
     """List available Confluence spaces with optional filtering.
     
     Args:
         query: Optional search text to filter spaces by name/description
         limit: Maximum number of spaces to return (default: 25)
+        fields: Fields to return, any of name, key, type, description, homepage
+            (default: name, key, type, description)
+        max_tokens: Approximate token budget for the response; whole spaces are
+            dropped past it and a continuation cursor is returned
+        cursor: Continuation cursor from a previous truncated response
+        output: Response format, text or compact json (default: text)
     """
+    error = check_output(output)
+    if error:
+        return error
+    fields = select_fields(fields, SPACE_FIELDS, DEFAULT_SPACE_FIELDS)
+    if isinstance(fields, str):  # Error case
+        return error_output(fields, output)
+    start = read_cursor(cursor, "start")
+    if start is None:
+        return error_output(invalid_cursor(cursor), output)
+
     url = f"{CONFLUENCE_BASE_URL}/space"
     params = {
-        "limit": limit,
-        "expand": "description.plain,homepage"
+        "limit": limit
     }
+    if start:
+        params["start"] = start
+    expand = expand_for(fields, SPACE_FIELDS)
+    if expand:
+        params["expand"] = ",".join(expand)
     if query:
         params["spaceKey"] = query
 
-    data = await make_confluence_request(url, params=params)
-    if isinstance(data, str):  # Error case
-        return data
+    spaces = await load_listing("spaces", url, params)
+    stale = None
+    if isinstance(spaces, str):  # Error case
+        fallback = await stale_listing("spaces", url, params, spaces)
+        if fallback is None:
+            return error_output(spaces, output)
+        spaces, stale = fallback
+
+    next_position = lambda count: {"start": start + count}
+    if output == "json":
+        records = [record_fields(space, fields, SPACE_FIELDS) for space in spaces]
+        return json_within_budget(records, max_tokens, next_position, {"stale": stale.record()} if stale else None)
 
     # Format the response
     result = []
-    for space in data.get("results", []):
-        space_info = f"""
-            Space: {space.get('name', 'Unknown')}
-            Key: {space.get('key', 'Unknown')}
-            Type: {space.get('type', 'Unknown')}
-            Description: {space.get('description', {}).get('plain', {}).get('value', 'No description')}
-            """
+    for space in spaces:
+        space_info = "\n" + render_fields(space, fields, SPACE_FIELDS, indent="            ") + "            "
         result.append(space_info)
 
-    return "\n---\n".join(result) if result else "No spaces found"
+    if not result:
+        return "No spaces found"
+    response = join_within_budget(result, max_tokens, next_position)
+    return f"{stale.note()}\n{response}" if stale else response
 
-@mcp.tool()
-async def get_page_content(page_id: str) -> str:
+def render_page(data: dict[str, Any], body_format: str) -> RenderedBody:
+    """Page body in the given format, using the rendering cached next to the raw body."""
+    storage = data.get("body", {}).get("storage", {}).get("value") or ""
+    key = (DEFAULT_AUTH.base_url, str(data.get("id")))
+    cached = PAGE_CACHE.get(key)
+    if cached is None or cached.data is not data:
+        return render_storage(storage, body_format)
+    body = cached.rendered.get(body_format)
+    if body is None:
+        body = cached.rendered[body_format] = render_storage(storage, body_format)
+        PAGE_CACHE.put(key, cached)  # account for the added size
+    return body
+
+def page_body(data: dict[str, Any], body_format: str) -> str:
+    if data.get("body", {}).get("storage", {}).get("value") is None:
+        return "No content"
+    if body_format == "raw":
+        return data["body"]["storage"]["value"]
+    return render_page(data, body_format).text
+
+def format_page(
+    data: dict[str, Any],
+    fields: tuple | list = DEFAULT_PAGE_FIELDS,
+    body_format: str = "markdown",
+    body: Optional[str] = None
+) -> str:
+    header = [field for field in fields if field != "body"]
+    result = "\n" + render_fields(data, header, PAGE_FIELDS, indent="        ")
+    if "body" in fields:
+        result += f"""
+        Content:
+        {page_body(data, body_format) if body is None else body}
+        """
+    else:
+        result += "        "
+    return result
+
+@dataclass
+class BodyWindow:
+    """Part of a page body, with its position in the whole body (or section)."""
+    text: str
+    start: int
+    end: int
+    total: int
+    # Where to continue when the window was shortened to fit a token budget
+    next_offset: Optional[int] = None
+
+    @property
+    def partial(self) -> bool:
+        return (self.start, self.end) != (0, self.total)
+
+    def render(self) -> str:
+        if not self.partial:
+            return self.text
+        return f"{self.text}\n\n[Showing characters {self.start}-{self.end} of {self.total}]"
+
+def page_record(
+    data: dict[str, Any],
+    fields: tuple | list = DEFAULT_PAGE_FIELDS,
+    body_format: str = "markdown",
+    window: Optional[BodyWindow] = None
+) -> dict[str, Any]:
+    """A page as a flat dict, for JSON output."""
+    record = {"id": data.get("id")}
+    record.update(record_fields(data, [field for field in fields if field != "body"], PAGE_FIELDS))
+    if "body" in fields:
+        if window is not None:
+            record["body"] = window.text
+            if window.partial:
+                record["range"] = {"start": window.start, "end": window.end, "total": window.total}
+            if window.next_offset is not None:
+                record["next_cursor"] = encode_cursor({"offset": window.next_offset})
+        elif data.get("body", {}).get("storage", {}).get("value") is not None:
+            record["body"] = page_body(data, body_format)
+        else:
+            record["body"] = None
+    return record
+
+def select_body_range(
+    data: dict[str, Any],
+    body_format: str,
+    section: Optional[str],
+    offset: int,
+    length: Optional[int],
+    max_tokens: Optional[int] = None
+) -> Optional[BodyWindow]:
+    """Cut a section and/or character window out of the parsed page body.
+
+    With a token budget the window is shortened to the last section, paragraph
+    or line boundary that fits. Returns None if the section does not exist.
+    """
+    rendered = render_page(data, body_format)
+    text = rendered.text
+    base = 0
+    if section:
+        match = rendered.find_section(section)
+        if match is None:
+            return None
+        base = match.start
+        text = text[match.start:match.end].rstrip()
+
+    total = len(text)
+    start = min(max(offset or 0, 0), total)
+    end = total if length is None else min(total, start + max(length, 0))
+    next_offset = None
+    if max_tokens is not None and estimate_tokens(text[start:end]) > max_tokens:
+        boundaries = [section.start - base - start for section in rendered.sections]
+        end = start + fit_text(text[start:end], max_tokens, boundaries)
+        next_offset = end
+    window = text[start:end] if next_offset is None else text[start:end].rstrip()
+    return BodyWindow(window, start, end, total, next_offset)
+
+def check_body_format(body_format: str) -> Optional[str]:
+    if body_format not in BODY_FORMATS:
+        return f"Error: Unknown format {body_format}. Available formats: {', '.join(BODY_FORMATS)}"
+    return None
+
+@mcp.tool(structured_output=False)
+@with_tool_deadline
+async def get_page_content(
+    page_id: str,
+    fields: Optional[list[str]] = None,
+    body_format: Optional[str] = "markdown",
+    section: Optional[str] = None,
+    offset: Optional[int] = 0,
+    length: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: Optional[str] = "text"
+) -> str | CallToolResult:
     """Get the content of a specific Confluence page.
+
+    For long pages, call get_page_outline first and read single sections, or
+    read the body in windows with offset/length.
     
     Args:
         page_id: The ID of the Confluence page
+        fields: Fields to return, any of title, space, version, labels, body (default: all)
+        body_format: Body format, one of markdown, text or raw storage XHTML (default: markdown)
+        section: Only return this section, by ID from get_page_outline (e.g. "2.1") or heading title
+        offset: Character offset into the body (or section) to start from (default: 0)
+        length: Maximum number of body characters to return (default: all)
+        max_tokens: Approximate token budget for the response; the body is cut at
+            a section or paragraph boundary and a continuation cursor is returned
+        cursor: Continuation cursor from a previous truncated response (pass the same section)
+        output: Response format, text or compact json (default: text)
     """
-    url = f"{CONFLUENCE_BASE_URL}/content/{page_id}"
-    params = {
-        "expand": "body.storage,version,space,metadata.labels"
-    }
+    error = check_output(output)
+    if error:
+        return error
+    fields = select_fields(fields, PAGE_FIELDS, DEFAULT_PAGE_FIELDS)
+    if isinstance(fields, str):  # Error case
+        return error_output(fields, output)
+    error = check_body_format(body_format)
+    if error:
+        return error_output(error, output)
+    if cursor:
+        offset = read_cursor(cursor, "offset")
+        if offset is None:
+            return error_output(invalid_cursor(cursor), output)
 
-    data = await make_confluence_request(url, params=params)
+    if "body" in fields:
+        data = await load_page(page_id)
+    else:
+        # Metadata only: fetch just the expands the fields need and skip the page cache
+        url = f"{CONFLUENCE_BASE_URL}/content/{page_id}"
+        expand = expand_for(fields, PAGE_FIELDS)
+        data = await make_confluence_request(url, params={"expand": ",".join(expand)} if expand else None)
+    stale = None
     if isinstance(data, str):  # Error case
-        return data
+        fallback = await stale_page(page_id, data)
+        if fallback is None:
+            return error_output(data, output)
+        data, stale = fallback
+
+    window = None
+    budget = token_budget(max_tokens)
+    if "body" in fields and (section or offset or length is not None or budget):
+        body_budget = None
+        if budget:
+            header = [field for field in fields if field != "body"]
+            header_text = format_page(data, fields, body_format, "") if output == "text" else dump_json(page_record(data, header))
+            body_budget = max(budget - estimate_tokens(header_text) - NOTE_TOKENS, 1)
+        window = select_body_range(data, body_format, section, offset, length, body_budget)
+        if window is None:
+            message = f"Error: Section {section} not found. Use get_page_outline to list the sections of this page."
+            return error_output(message, output)
+
+    if output == "json":
+        record = page_record(data, fields, body_format, window)
+        if stale:
+            record["stale"] = stale.record()
+        return json_result(record)
+
+    body = None
+    if window is not None:
+        body = window.render()
+        if window.next_offset is not None:
+            body += "\n\n" + truncation_note({"offset": window.next_offset})
 
     # Format the response
-    title = data.get("title", "Unknown")
-    space = data.get("space", {}).get("name", "Unknown")
-    version = data.get("version", {}).get("number", "Unknown")
-    content = data.get("body", {}).get("storage", {}).get("value", "No content")
-    labels = [label.get("name") for label in data.get("metadata", {}).get("labels", {}).get("results", [])]
+    response = format_page(data, fields, body_format, body)
+    return f"{stale.note()}\n{response}" if stale else response
 
-    return f"""
-        Title: {title}
-        Space: {space}
-        Version: {version}
-        Labels: {', '.join(labels) if labels else 'No labels'}
+@mcp.tool(structured_output=False)
+@with_tool_deadline
+async def get_page_outline(
+    page_id: str,
+    body_format: Optional[str] = "markdown",
+    max_tokens: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: Optional[str] = "text"
+) -> str | CallToolResult:
+    """Get the heading tree of a Confluence page with section IDs and sizes.
 
-        Content:
-        {content}
-        """
+    Use the section IDs with get_page_content(section=...) to read one section.
+    
+    Args:
+        page_id: The ID of the Confluence page
+        body_format: Format the section sizes are measured in, one of markdown, text or raw (default: markdown)
+        max_tokens: Approximate token budget for the response; a continuation cursor is returned past it
+        cursor: Continuation cursor from a previous truncated response
+        output: Response format, text or compact json (default: text)
+    """
+    error = check_output(output)
+    if error:
+        return error
+    error = check_body_format(body_format)
+    if error:
+        return error_output(error, output)
+    index = read_cursor(cursor, "index")
+    if index is None:
+        return error_output(invalid_cursor(cursor), output)
 
-@mcp.tool()
+    data = await load_page(page_id)
+    if isinstance(data, str):  # Error case
+        return error_output(data, output)
+
+    rendered = render_page(data, body_format)
+    if output == "json":
+        header = {
+            "id": data.get("id"),
+            "title": data.get("title"),
+            "version": data.get("version", {}).get("number"),
+            "size": len(rendered.text),
+        }
+        records = [
+            {"id": section.id, "level": section.level, "title": section.title, "size": section.end - section.start}
+            for section in rendered.sections[index:]
+        ]
+        return json_within_budget(records, max_tokens, lambda count: {"index": index + count}, header, key="sections")
+
+    header = "\n".join([
+        f"Title: {data.get('title', 'Unknown')}",
+        f"Version: {data.get('version', {}).get('number', 'Unknown')}",
+        f"Size: {len(rendered.text)} characters",
+        "",
+    ])
+    if not rendered.sections:
+        return header + "\nNo headings found"
+
+    lines = []
+    for section in rendered.sections[index:]:
+        indent = "  " * section.id.count(".")
+        lines.append(f"{indent}{section.id} {section.title} ({section.end - section.start} characters)")
+
+    # Sections are fitted to what the header leaves, and at least one is kept so the cursor moves on
+    budget = token_budget(max_tokens)
+    if budget:
+        budget = max(budget - estimate_tokens(header), 1)
+    return header + "\n" + join_within_budget(lines, budget, lambda count: {"index": index + count}, separator="\n")
+
+@mcp.tool(structured_output=False)
+@with_tool_deadline
+async def get_pages(
+    page_ids: list[str],
+    body_format: Optional[str] = "markdown",
+    max_tokens: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: Optional[str] = "text"
+) -> str | CallToolResult:
+    """Get the content of several Confluence pages in one call.
+
+    Prefer this over repeated get_page_content calls, e.g. for the hits of a search.
+    
+    Args:
+        page_ids: The IDs of the Confluence pages; results come back in the same order
+        body_format: Body format, one of markdown, text or raw storage XHTML (default: markdown)
+        max_tokens: Approximate token budget for the response; whole pages are
+            dropped past it and a continuation cursor is returned
+        cursor: Continuation cursor from a previous truncated response (pass the same page_ids)
+        output: Response format, text or compact json (default: text)
+    """
+    error = check_output(output)
+    if error:
+        return error
+    if not page_ids:
+        return error_output("No page IDs given", output)
+    error = check_body_format(body_format)
+    if error:
+        return error_output(error, output)
+    index = read_cursor(cursor, "index")
+    if index is None:
+        return error_output(invalid_cursor(cursor), output)
+
+    page_ids = [str(page_id) for page_id in page_ids[index:]]
+    pages = await load_pages(page_ids)
+    budget = token_budget(max_tokens)
+
+    def render(page_id: str, data: dict[str, Any] | str, window: Optional[BodyWindow] = None) -> str | dict[str, Any]:
+        if isinstance(data, str):  # Error case
+            return f"\nID: {page_id}\n{data}\n" if output == "text" else {"id": page_id, "error": data}
+        if output == "json":
+            return page_record(data, body_format=body_format, window=window)
+        if window is None:
+            return format_page(data, body_format=body_format)
+        body = (f'{window.render()}\n\n[Page truncated to fit the token budget. Call get_page_content(page_id="{page_id}", '
+                f'cursor="{encode_cursor({"offset": window.next_offset or 0})}") for the rest.]')
+        return format_page(data, body_format=body_format, body=body)
+
+    def size(item: str | dict[str, Any]) -> int:
+        return estimate_tokens(item if output == "text" else dump_json(item)) + 2
+
+    # Format the response
+    result = []
+    next_index = None
+    used = NOTE_TOKENS
+    for position, (page_id, data) in enumerate(zip(page_ids, pages)):
+        item = render(page_id, data)
+        if budget:
+            used += size(item)
+        if budget and used > budget:
+            if not result:
+                # The first item always goes out so the cursor moves past it: an error
+                # as it is, a page larger than the whole budget cut to the part that fits
+                if not isinstance(data, str):
+                    header_tokens = size(render(page_id, data, BodyWindow("", 0, 0, 0)))
+                    window = select_body_range(data, body_format, None, 0, None, max(budget - header_tokens - 2 * NOTE_TOKENS, 1))
+                    item = render(page_id, data, window)
+                result.append(item)
+                position += 1
+            if position < len(page_ids):
+                next_index = index + position
+            break
+        result.append(item)
+
+    if output == "json":
+        envelope = {"results": result}
+        if next_index is not None:
+            envelope["next_cursor"] = encode_cursor({"index": next_index})
+        return json_result(envelope)
+    if next_index is not None:
+        result.append(truncation_note({"index": next_index}))
+    return "\n---\n".join(result)
+
+SEARCH_HIGHLIGHT = re.compile(r"@@@hl@@@(.*?)@@@endhl@@@", re.S)
+
+def storage_preview(storage: str, max_chars: int) -> str:
+    """Plain-text preview of storage-format XHTML, cut to max_chars."""
+    text = WHITESPACE.sub(" ", convert_storage(storage, "text")).strip()
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "..."
+
+def search_hits(data: dict[str, Any]) -> list[dict[str, Any]]:
+    """Content objects of a /content/search or /search response, with excerpts attached."""
+    hits = []
+    for result in strip_links(data.get("results", [])):
+        if "content" in result:  # /search wraps each content object
+            content = dict(result["content"])
+            content["excerpt"] = result.get("excerpt")
+            if "version" not in content and result.get("lastModified"):
+                content["version"] = {"when": result["lastModified"]}
+            hits.append(content)
+        else:
+            hits.append(result)
+    return hits
+
+@mcp.tool(structured_output=False)
+@with_tool_deadline
 async def search_content(
     query: str,
     space_key: Optional[str] = None,
-    limit: Optional[int] = 25
-) -> str:
+    limit: Optional[int] = 25,
+    include_excerpts: Optional[bool] = False,
+    include_body: Optional[bool] = False,
+    body_chars: Optional[int] = 500,
+    fields: Optional[list[str]] = None,
+    max_tokens: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: Optional[str] = "text"
+) -> str | CallToolResult:
     """Search for content in Confluence.
+
+    Use include_excerpts/include_body to decide which hits are worth a full
+    get_page_content call without fetching each of them.
     
     Args:
         query: Text to search for
         space_key: Optional space key to limit search to
         limit: Maximum number of results to return (default: 25)
+        include_excerpts: Include a highlighted excerpt of each match (default: False)
+        include_body: Include the start of each page body as plain text (default: False)
+        body_chars: Maximum characters of body to include per result (default: 500)
+        fields: Fields to return per result, any of title, type, space, id, updated (default: all)
+        max_tokens: Approximate token budget for the response; whole results are
+            dropped past it and a continuation cursor is returned
+        cursor: Continuation cursor from a previous truncated response
+        output: Response format, text or compact json (default: text)
     """
-    url = f"{CONFLUENCE_BASE_URL}/content/search"
-    
+    error = check_output(output)
+    if error:
+        return error
+    fields = select_fields(fields, SEARCH_FIELDS, DEFAULT_SEARCH_FIELDS)
+    if isinstance(fields, str):  # Error case
+        return error_output(fields, output)
+    start = read_cursor(cursor, "start")
+    if start is None:
+        return error_output(invalid_cursor(cursor), output)
+
     cql = f'text ~ "{query}"'
     if space_key:
         cql += f' AND space.key = "{space_key}"'
 
-    params = {
-        "cql": cql,
-        "limit": limit,
-        "expand": "space,version"
-    }
+    if include_excerpts:
+        # Only the generic search endpoint returns excerpts; it nests content under "content"
+        url = f"{CONFLUENCE_BASE_URL}/search"
+        prefix = "content."
+        params = {
+            "cql": cql,
+            "limit": limit,
+            "excerpt": "highlight"
+        }
+    else:
+        url = f"{CONFLUENCE_BASE_URL}/content/search"
+        prefix = ""
+        params = {
+            "cql": cql,
+            "limit": limit
+        }
+    expand = [prefix + name for name in expand_for(fields, SEARCH_FIELDS)]
+    if include_body:
+        expand.append(prefix + "body.storage")
+    if expand:
+        params["expand"] = ",".join(expand)
+    if start:
+        params["start"] = start
 
     data = await make_confluence_request(url, params=params)
     if isinstance(data, str):  # Error case
-        return data
+        return error_output(data, output)
+
+    next_position = lambda count: {"start": start + count}
+    if output == "json":
+        records = []
+        for content in search_hits(data):
+            record = record_fields(content, fields, SEARCH_FIELDS)
+            if include_excerpts:
+                record["excerpt"] = WHITESPACE.sub(" ", SEARCH_HIGHLIGHT.sub(r"**\1**", content.get("excerpt") or "")).strip()
+            if include_body:
+                record["body"] = storage_preview(content.get("body", {}).get("storage", {}).get("value", ""), body_chars) or None
+            records.append(record)
+        return json_within_budget(records, max_tokens, next_position)
 
     # Format the response
     result = []
-    for content in data.get("results", []):
-        content_info = f"""
-Title: {content.get('title', 'Unknown')}
-Type: {content.get('type', 'Unknown')}
-Space: {content.get('space', {}).get('name', 'Unknown')}
-ID: {content.get('id', 'Unknown')}
-Last Updated: {content.get('version', {}).get('when', 'Unknown')}
-"""
+    for content in search_hits(data):
+        content_info = "\n" + render_fields(content, fields, SEARCH_FIELDS)
+        if include_excerpts and content.get("excerpt"):
+            excerpt = SEARCH_HIGHLIGHT.sub(r"**\1**", content["excerpt"])
+            content_info += f"Excerpt: {WHITESPACE.sub(' ', excerpt).strip()}\n"
+        if include_body:
+            storage = content.get("body", {}).get("storage", {}).get("value", "")
+            content_info += f"Body: {storage_preview(storage, body_chars) or 'No content'}\n"
         result.append(content_info)
 
-    return "\n---\n".join(result) if result else "No results found"
+    if not result:
+        return "No results found"
+    return join_within_budget(result, max_tokens, next_position)
 
-@mcp.tool()
+def format_page_summary(page: dict[str, Any]) -> str:
+    return f"""
+Title: {page.get('title', 'Unknown')}
+ID: {page.get('id', 'Unknown')}
+Last Updated: {page.get('version', {}).get('when', 'Unknown')}
+"""
+
+def page_summary_record(page: dict[str, Any]) -> dict[str, Any]:
+    return {"id": page.get("id"), "title": page.get("title"), "updated": page.get("version", {}).get("when")}
+
+@mcp.tool(structured_output=False)
+@with_tool_deadline
 async def list_pages_in_space(
     space_key: str,
-    limit: Optional[int] = 25
-) -> str:
+    limit: Optional[int] = 25,
+    auto_paginate: Optional[bool] = False,
+    max_results: Optional[int] = 1000,
+    max_tokens: Optional[int] = None,
+    cursor: Optional[str] = None,
+    output: Optional[str] = "text"
+) -> str | CallToolResult:
     """List all pages in a Confluence space.
     
     Args:
         space_key: The key of the space to list pages from
         limit: Maximum number of pages to return (default: 25)
+        auto_paginate: Follow next links to list beyond a single page of results (default: False)
+        max_results: Maximum number of pages to return when auto_paginate is set (default: 1000)
+        max_tokens: Approximate token budget for the response; listing stops at a
+            whole page entry and a continuation cursor is returned
+        cursor: Continuation cursor from a previous truncated response
+        output: Response format, text or compact json (default: text)
     """
+    error = check_output(output)
+    if error:
+        return error
+    start = read_cursor(cursor, "start")
+    if start is None:
+        return error_output(invalid_cursor(cursor), output)
+
     url = f"{CONFLUENCE_BASE_URL}/content"
+    if auto_paginate:
+        # Format each upstream batch as it arrives instead of collecting every page first
+        budget = token_budget(max_tokens)
+        text = io.StringIO()
+        records = []
+        count = 0
+        used = NOTE_TOKENS
+        truncated = False
+        failure = None
+        stale = None
+        # Complete runs of up to one batch are kept for the serve-stale fallback under their
+        # own listing key; longer runs are not, so a large space is never held in memory
+        params = {"spaceKey": space_key, "type": "page", "expand": "version", "start": start, "max_results": max_results}
+        listed: Optional[list] = []
+        async with aclosing(iter_space_pages(space_key, max_results, start)) as batches:
+            async for batch in batches:
+                if isinstance(batch, str):  # Error case
+                    if count:
+                        failure = batch
+                        break
+                    fallback = await stale_listing("space_pages", url, params, batch)
+                    if fallback is None:
+                        return error_output(batch, output)
+                    batch, stale = fallback
+                if listed is not None:
+                    listed = listed + batch if len(listed) + len(batch) <= LIST_PAGE_BATCH_SIZE else None
+                for page in batch:
+                    if output == "json":
+                        record = page_summary_record(page)
+                        if budget:
+                            used += estimate_tokens(dump_json(record)) + 1
+                    else:
+                        page_info = format_page_summary(page)
+                        used += estimate_tokens(page_info) + 2
+                    if budget and used > budget and count:
+                        truncated = True
+                        break
+                    if output == "json":
+                        records.append(record)
+                    else:
+                        if count:
+                            text.write("\n---\n")
+                        text.write(page_info)
+                    count += 1
+                if truncated or stale:
+                    break
+        if listed is not None and not (truncated or failure or stale):
+            auth = DEFAULT_AUTH
+            remember_listing("space_pages", auth, listing_request(url, params), listed)
+
+        if output == "json":
+            envelope = {"stale": stale.record()} if stale else {}
+            envelope["results"] = records
+            if truncated:
+                envelope["next_cursor"] = encode_cursor({"start": start + count})
+            if failure:
+                envelope["error"] = failure
+            return json_result(envelope)
+        if not count:
+            return f"No pages found in space {space_key}"
+        if truncated:
+            text.write("\n---\n" + truncation_note({"start": start + count}))
+        if failure:
+            text.write(f"\n---\n{failure}")
+        return f"{stale.note()}\n{text.getvalue()}" if stale else text.getvalue()
+
     params = {
         "spaceKey": space_key,
         "type": "page",
         "limit": limit,
         "expand": "version"
     }
+    if start:
+        params["start"] = start
 
-    data = await make_confluence_request(url, params=params)
-    if isinstance(data, str):  # Error case
-        return data
+    pages = await load_listing("space_pages", url, params)
+    stale = None
+    if isinstance(pages, str):  # Error case
+        fallback = await stale_listing("space_pages", url, params, pages)
+        if fallback is None:
+            return error_output(pages, output)
+        pages, stale = fallback
+
+    next_position = lambda count: {"start": start + count}
+    if output == "json":
+        records = [page_summary_record(page) for page in pages]
+        return json_within_budget(records, max_tokens, next_position, {"stale": stale.record()} if stale else None)
 
     # Format the response
-    result = []
-    for page in data.get("results", []):
-        page_info = f"""
-Title: {page.get('title', 'Unknown')}
-ID: {page.get('id', 'Unknown')}
-Last Updated: {page.get('version', {}).get('when', 'Unknown')}
-"""
-        result.append(page_info)
+    result = [format_page_summary(page) for page in pages]
 
-    return "\n---\n".join(result) if result else f"No pages found in space {space_key}"
+    if not result:
+        return f"No pages found in space {space_key}"
+    response = join_within_budget(result, max_tokens, next_position)
+    return f"{stale.note()}\n{response}" if stale else response
+
+@mcp.tool()
+async def get_server_stats() -> str:
+    """Report cache memory usage and other runtime statistics of this server."""
+    store = await PAGE_STORE.stats() if PAGE_STORE else "disabled"
+    return f"""
+Page cache: {PAGE_CACHE.stats()}
+Space cache: {SPACE_CACHE.entries.stats()}
+Page list cache: {PAGE_LIST_CACHE.entries.stats()}
+Page store: {store}
+JSON codec: {JSON_CODEC}
+Accept-Encoding: {accept_encoding()}
+Transfers: {TRANSFER_STATS.stats()}
+Circuit breakers: {", ".join(f"{site} {breaker.stats()}" for site, breaker in _circuit_breakers.items()) or "no requests yet"}
+Bulkheads:
+  {GLOBAL_BULKHEAD.stats()}
+""" + "".join(f"  {bulkhead.stats()}\n" for bulkhead in BULKHEADS.values())
 
 if __name__ == "__main__":
     # Add startup message
     print("Confluence MCP server starting...", file=sys.stderr)
-    print("NOTE: Please set CONFLUENCE_BASE_URL and AUTH_TOKEN before using", file=sys.stderr)
+    print("NOTE: Please set CONFLUENCE_BASE_URL and USERNAME/API_TOKEN (or CONFLUENCE_PAT) before using", file=sys.stderr)
     # Initialize and run the server
     mcp.run(transport='stdio')
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+# confluence.py reads its settings when imported
+os.environ.update({
+    "PORT": "8000",
+    "CONFLUENCE_BASE_URL": "https://example.atlassian.net/wiki/rest/api",
+    "USERNAME": "user@example.com",
+    "API_TOKEN": "token",
+    "PAGE_STORE_PATH": "",
+    "RETRY_MAX_ATTEMPTS": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import confluence  # noqa: E402
+
+@pytest.fixture
+def mock_confluence(monkeypatch):
+    """Route Confluence requests to a handler; returns the list of requests sent."""
+    requests = []
+
+    def install(handler):
+        def record(request):
+            requests.append(request)
+            return handler(request)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+        monkeypatch.setattr(confluence, "_http_client", client)
+        monkeypatch.setattr(confluence, "_rate_limiters", {})
+        monkeypatch.setattr(confluence, "_circuit_breakers", {})
+        monkeypatch.setattr(confluence, "PAGE_CACHE", confluence.LRUCache(1 << 20, sizeof=confluence.CachedPage.size))
+        return requests
+
+    return install
@@ -0,0 +1,105 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+import confluence
+from confluence import (
+    NOTE_TOKENS, encode_cursor, estimate_tokens, fit_count, fit_text, join_within_budget, read_cursor
+)
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"start": 50})
+    assert "=" not in cursor
+    assert read_cursor(cursor, "start") == 50
+
+def test_missing_cursor_starts_at_zero():
+    assert read_cursor(None, "start") == 0
+    assert read_cursor("", "offset") == 0
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor({"offset": 10}),
+    encode_cursor({"start": -1}),
+    base64.urlsafe_b64encode(b'{"start": "10"}').decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+])
+def test_invalid_cursors(cursor):
+    assert read_cursor(cursor, "start") is None
+
+def test_fit_text_prefers_section_boundaries():
+    text = "a" * 40 + "\n\n" + "b" * 40 + "\n\n" + "c" * 40
+    assert fit_text(text, 25, [42, 84]) == 84
+
+def test_fit_text_falls_back_to_paragraphs_then_lines():
+    paragraphs = "a" * 40 + "\n\n" + "b" * 40 + "\n\n" + "c" * 40
+    assert fit_text(paragraphs, 25, []) == 84
+    lines = "a" * 40 + "\n" + "b" * 40 + "\n" + "c" * 40
+    assert fit_text(lines, 25, []) == 82
+
+def test_fit_text_cuts_unbroken_text_mid_line():
+    assert fit_text("x" * 100, 10, []) == 40
+    assert fit_text("x" * 100, 0, []) == 1
+
+def test_fit_count():
+    assert fit_count([10, 10, 10], 30) == 3
+    # Once blocks are dropped, room is kept for the truncation note
+    assert fit_count([20] * 5, NOTE_TOKENS + 50) == 2
+    assert fit_count([100, 10], 50) == 1
+
+def test_join_within_budget_adds_a_cursor_for_the_rest():
+    blocks = ["x" * 200] * 5
+    assert join_within_budget(blocks, None, lambda count: {"start": count}) == "\n---\n".join(blocks)
+    joined = join_within_budget(blocks, 200, lambda count: {"start": 10 + count})
+    kept, note = joined.rsplit("\n---\n", 1)
+    count = kept.count("x" * 200)
+    assert 0 < count < 5
+    assert encode_cursor({"start": 10 + count}) in note
+    assert estimate_tokens(joined) <= 200
+
+def page(page_id: str, body: str) -> dict:
+    return {"id": page_id, "title": f"Page {page_id}", "version": {"number": 1}, "body": {"storage": {"value": body}}}
+
+def serve_pages(pages: dict):
+    def handler(request):
+        page_id = request.url.path.rsplit("/", 1)[1]
+        if request.url.path.endswith("/search"):
+            return httpx.Response(200, json={"results": []})
+        if page_id not in pages:
+            return httpx.Response(404)
+        return httpx.Response(200, json=pages[page_id])
+    return handler
+
+def outline_cursor(text: str) -> str:
+    return text.rsplit('cursor="', 1)[1].split('"')[0]
+
+def test_outline_cursor_always_moves_on(mock_confluence):
+    body = "".join(f"<h2>Heading number {i}</h2><p>{'text ' * 20}</p>" for i in range(10))
+    mock_confluence(serve_pages({"1": page("1", body)}))
+    seen = []
+    cursor = None
+    for _ in range(20):
+        text = asyncio.run(confluence.get_page_outline("1", max_tokens=30, cursor=cursor))
+        seen += [line.split()[0] for line in text.splitlines() if line.startswith(tuple("0123456789"))]
+        if 'cursor="' not in text:
+            break
+        cursor = outline_cursor(text)
+    assert seen == [str(i + 1) for i in range(10)]
+
+def test_get_pages_returns_a_leading_error_before_moving_on(mock_confluence):
+    mock_confluence(serve_pages({"2": page("2", "<p>" + "word " * 200 + "</p>")}))
+    first = asyncio.run(confluence.get_pages(["1", "2"], max_tokens=60))
+    assert "ID: 1" in first and "404" in first
+    second = asyncio.run(confluence.get_pages(["1", "2"], max_tokens=60, cursor=outline_cursor(first)))
+    assert "Title: Page 2" in second
+
+def test_json_output_is_measured_as_sent(mock_confluence):
+    pages = {str(i): page(str(i), "<p>" + "word " * 40 + "</p>") for i in range(10)}
+    mock_confluence(serve_pages(pages))
+    result = asyncio.run(confluence.get_pages(list(pages), max_tokens=200, output="json"))
+    text = result.content[0].text
+    assert estimate_tokens(text) <= 200
+    assert json.loads(text) == result.structuredContent
+    assert "next_cursor" in result.structuredContent
@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+import pytest
+
+import confluence
+from confluence import CircuitBreaker, CircuitOpen
+
+URL = f"{confluence.CONFLUENCE_BASE_URL}/content/1"
+
+@pytest.fixture(autouse=True)
+def small_window(monkeypatch):
+    monkeypatch.setattr(confluence, "CIRCUIT_BREAKER_ENABLED", True)
+    monkeypatch.setattr(confluence, "CIRCUIT_WINDOW", 4)
+    monkeypatch.setattr(confluence, "CIRCUIT_MIN_CALLS", 4)
+    monkeypatch.setattr(confluence, "CIRCUIT_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(confluence, "CIRCUIT_SLOW_CALL_SECONDS", 1.0)
+    monkeypatch.setattr(confluence, "CIRCUIT_SLOW_CALL_RATE", 0.75)
+    monkeypatch.setattr(confluence, "CIRCUIT_HALF_OPEN_TRIALS", 2)
+
+def tripped() -> CircuitBreaker:
+    breaker = CircuitBreaker()
+    for _ in range(4):
+        breaker.acquire(URL)
+        breaker.record(False, 0.1)
+    return breaker
+
+def cool_down(breaker: CircuitBreaker) -> None:
+    breaker.opened_at -= confluence.CIRCUIT_OPEN_SECONDS
+
+def test_stays_closed_until_min_calls():
+    breaker = CircuitBreaker()
+    for _ in range(3):
+        breaker.acquire(URL)
+        breaker.record(False, 0.1)
+    assert breaker.state == "closed"
+
+def test_opens_on_failure_rate_and_fails_fast():
+    breaker = CircuitBreaker()
+    for success in (True, True, False, False):
+        breaker.acquire(URL)
+        breaker.record(success, 0.1)
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+    with pytest.raises(CircuitOpen):
+        breaker.acquire(URL)
+    assert breaker.rejected == 1
+
+def test_opens_on_slow_call_rate():
+    breaker = CircuitBreaker()
+    for latency in (2.0, 2.0, 2.0, 0.1):
+        breaker.acquire(URL)
+        breaker.record(True, latency)
+    assert breaker.state == "open"
+
+def test_old_outcomes_leave_the_window():
+    breaker = CircuitBreaker()
+    for success in (False, True, True, True, True, False):
+        breaker.acquire(URL)
+        breaker.record(success, 0.1)
+    assert breaker.state == "closed"
+
+def test_half_open_closes_after_successful_trials():
+    breaker = tripped()
+    cool_down(breaker)
+    breaker.acquire(URL)
+    breaker.acquire(URL)
+    assert breaker.state == "half-open"
+    with pytest.raises(CircuitOpen):
+        breaker.acquire(URL)
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+    breaker.acquire(URL)
+
+def test_half_open_reopens_on_failed_or_slow_trial():
+    for success, latency in ((False, 0.1), (True, 2.0)):
+        breaker = tripped()
+        cool_down(breaker)
+        breaker.acquire(URL)
+        breaker.record(success, latency)
+        assert breaker.state == "open"
+        assert breaker.trips == 2
+
+def test_release_frees_a_trial_slot():
+    breaker = tripped()
+    cool_down(breaker)
+    breaker.acquire(URL)
+    breaker.acquire(URL)
+    breaker.release()
+    breaker.acquire(URL)
+    assert breaker.trials == 2
+
+def test_server_errors_open_the_site_circuit(mock_confluence):
+    requests = mock_confluence(lambda request: httpx.Response(503))
+
+    async def run():
+        return [await confluence.make_confluence_request(URL) for _ in range(5)]
+
+    results = asyncio.run(run())
+    assert len(requests) == 4
+    assert "Circuit open" in results[-1]
+    assert isinstance(results[-1], confluence.UpstreamError)
+
+def test_body_stall_is_recorded_as_a_failure(mock_confluence):
+    class StalledStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"id": "1", "title": '
+            raise httpx.ReadTimeout("")
+
+    mock_confluence(lambda request: httpx.Response(200, stream=StalledStream()))
+    result = asyncio.run(confluence.make_confluence_request(URL))
+    assert result == "Error making request: ReadTimeout"
+    breaker = confluence.circuit_breaker_for(confluence.DEFAULT_AUTH)
+    assert list(breaker.outcomes) == [(False, False)]
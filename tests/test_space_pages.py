@@ -0,0 +1,83 @@
+import asyncio
+from typing import Optional
+
+import httpx
+import pytest
+
+import confluence
+
+class SpaceServer:
+    """Paged /content listing that caps limit like Confluence Cloud does."""
+
+    def __init__(self, pages: int, cap: int = 100, count: Optional[int] = -1, fail_at: Optional[int] = None):
+        self.pages = pages
+        self.cap = cap
+        self.count = pages if count == -1 else count
+        self.fail_at = fail_at
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/search"):
+            return httpx.Response(200, json={"results": [], "totalSize": self.count} if self.count is not None else {})
+        start = int(request.url.params.get("start", 0))
+        if start == self.fail_at:
+            return httpx.Response(404)
+        limit = min(int(request.url.params["limit"]), self.cap)
+        results = [{"id": str(i), "title": f"Page {i}"} for i in range(start, min(start + limit, self.pages))]
+        links = {"base": "https://example.atlassian.net/wiki"}
+        if start + limit < self.pages:
+            links["next"] = f"/rest/api/content?spaceKey=S&type=page&start={start + limit}&limit={limit}&expand=version"
+        return httpx.Response(200, json={
+            "results": results, "start": start, "limit": limit, "size": len(results), "_links": links
+        })
+
+def list_ids(max_results: int = 1000, start: int = 0) -> list:
+    async def run():
+        batches = []
+        async for batch in confluence.iter_space_pages("S", max_results, start):
+            batches.append(batch if isinstance(batch, str) else [int(page["id"]) for page in batch])
+        return batches
+    return asyncio.run(run())
+
+def flatten(batches: list) -> list[int]:
+    return [page_id for batch in batches for page_id in batch]
+
+def content_requests(requests: list) -> list[tuple[int, int]]:
+    return [
+        (int(request.url.params.get("start", 0)), int(request.url.params["limit"]))
+        for request in requests if request.url.path.endswith("/content")
+    ]
+
+def test_windows_follow_the_reported_page_size(mock_confluence):
+    requests = mock_confluence(SpaceServer(600, cap=100))
+    assert flatten(list_ids()) == list(range(600))
+    windows = content_requests(requests)
+    assert windows[0] == (0, confluence.LIST_PAGE_BATCH_SIZE)
+    assert windows[1:] == [(start, 100) for start in range(100, 600, 100)]
+
+def test_uncapped_server_uses_the_batch_size(mock_confluence):
+    requests = mock_confluence(SpaceServer(600, cap=1000))
+    assert flatten(list_ids()) == list(range(600))
+    assert [start for start, _ in content_requests(requests)] == [0, 250, 500]
+
+def test_unknown_count_walks_next_links(mock_confluence):
+    mock_confluence(SpaceServer(600, count=None))
+    assert flatten(list_ids()) == list(range(600))
+
+@pytest.mark.parametrize("count", [450, 700])
+def test_out_of_date_count_leaves_no_gap(mock_confluence, count):
+    mock_confluence(SpaceServer(600, count=count))
+    assert flatten(list_ids()) == list(range(600))
+
+def test_start_and_max_results(mock_confluence):
+    mock_confluence(SpaceServer(600, cap=37))
+    assert flatten(list_ids(max_results=250, start=130)) == list(range(130, 380))
+
+def test_failed_window_ends_iteration(mock_confluence):
+    mock_confluence(SpaceServer(600, fail_at=300))
+    batches = list_ids()
+    assert flatten(batches[:-1]) == list(range(300))
+    assert isinstance(batches[-1], str) and "404" in batches[-1]
+
+def test_empty_space(mock_confluence):
+    mock_confluence(SpaceServer(0))
+    assert list_ids() == []
@@ -0,0 +1,79 @@
+from confluence import StorageConverter, convert_storage, render_storage
+
+STORAGE = (
+    '<h1>Title</h1><p>Some <strong>bold</strong> and <em>it</em> &amp; text.</p>'
+    '<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">python</ac:parameter>'
+    '<ac:plain-text-body><![CDATA[print("x")\ny = 1 < 2]]></ac:plain-text-body></ac:structured-macro>'
+    '<table><tbody><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>2</td></tr></tbody></table>'
+    '<ul><li>one</li><li>two<ul><li>nested</li></ul></li></ul><ol><li>first</li><li>second</li></ol>'
+    '<ac:structured-macro ac:name="info"><ac:rich-text-body><p>Heads up</p></ac:rich-text-body></ac:structured-macro>'
+    '<p><a href="https://e.com">link</a> <ac:link><ri:page ri:content-title="Other"/>'
+    '<ac:plain-text-link-body><![CDATA[Other page]]></ac:plain-text-link-body></ac:link></p>'
+    '<ac:task-list><ac:task><ac:task-id>1</ac:task-id><ac:task-status>complete</ac:task-status>'
+    '<ac:task-body>done it</ac:task-body></ac:task></ac:task-list>'
+    '<h2>Sub</h2><p style="color:red">styled</p>'
+)
+
+MARKDOWN = """# Title
+
+Some **bold** and _it_ & text.
+
+```python
+print("x")
+y = 1 < 2
+```
+
+| A | B |
+| --- | --- |
+| 1 | 2 |
+
+- one
+- two
+  - nested
+
+1. first
+2. second
+
+> **Info:** Heads up
+
+[link](https://e.com) Other page
+
+- [x] done it
+
+## Sub
+
+styled"""
+
+def test_markdown():
+    assert convert_storage(STORAGE, "markdown") == MARKDOWN
+
+def test_text_drops_markup():
+    text = convert_storage(STORAGE, "text")
+    assert text.startswith("Title\n\nSome bold and it & text.\n\nprint(\"x\")\ny = 1 < 2\n\nA | B\n1 | 2\n")
+    assert "Info: Heads up" in text
+    assert "link (https://e.com) Other page" in text
+    assert "**" not in text and "```" not in text
+
+def test_raw_is_unchanged():
+    assert convert_storage(STORAGE, "raw") == STORAGE
+
+def test_chunked_feed_matches_whole_body():
+    converter = StorageConverter()
+    for start in range(0, len(STORAGE), 7):
+        converter.feed(STORAGE[start:start + 7])
+    assert converter.finish() == MARKDOWN
+
+def test_sections_follow_headings():
+    rendered = render_storage(STORAGE, "markdown")
+    sections = [(section.id, section.level, section.title) for section in rendered.sections]
+    assert sections == [("1", 1, "Title"), ("1.1", 2, "Sub")]
+    sub = rendered.sections[1]
+    assert rendered.text[sub.start:sub.end] == "## Sub\n\nstyled"
+    assert rendered.sections[0].end == len(rendered.text)
+
+def test_other_macros_reduce_to_what_they_show():
+    status = ('<ac:structured-macro ac:name="status"><ac:parameter ac:name="title">Done</ac:parameter>'
+              '</ac:structured-macro>')
+    excerpt = '<ac:structured-macro ac:name="excerpt"><ac:rich-text-body><p>kept</p></ac:rich-text-body></ac:structured-macro>'
+    assert convert_storage(status, "markdown") == "[Done]"
+    assert convert_storage(excerpt, "markdown") == "kept"